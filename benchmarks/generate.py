@@ -0,0 +1,111 @@
+import argparse
+import datetime
+import html
+import os
+import random
+
+
+FIRST_NAMES = ['Alice', 'Bob', 'Carol', 'Dave', 'Emma', 'Frank', 'Grace', 'Hugo', 'Iris', 'Jules', 'Karen', 'Louis',
+               'Marie', 'Nina', 'Oscar', 'Paul', 'Quinten', 'Rosa', 'Sam', 'Tess']
+LAST_NAMES = ['Peeters', 'Janssens', 'Maes', 'Jacobs', 'Mertens', 'Willems', 'Claes', 'Goossens', 'Wouters',
+              'De Smet']
+WORDS = ['hey', 'are', 'you', 'coming', 'tonight', 'haha', 'sure', 'see', 'you', 'there', 'thanks', 'for', 'the',
+         'pictures', 'what', 'time', 'tomorrow', 'ok', 'great', 'idea', 'Jérôme', '&', '<3', '"quoted"']
+REACTIONS = ['like', 'love', 'haha', 'wow', 'sorry', 'anger']
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October',
+               'November', 'December']
+
+OWNER = "Me Myself"
+BLOCK = '<div class="pam _3-95 _2pi0 _2lej uiBoxWhite noborder">'
+HEADER = ('<html><head><meta charset="utf-8" /><title>{}</title></head><body><div class="_li"><div class="_3a_u">'
+          '<div class="_4t5n" role="main">')
+FOOTER = '</div></div></div></body></html>'
+
+
+def generate(data_path, chats=10, messages=1000, senders=3, years=3, reactions=1000, seed=0):
+    """
+    Write a synthetic export in the markup the parser expects.
+
+    Parameters
+    ----------
+    data_path : str
+        Directory to write messages/inbox/<chat>/message.html and
+        likes_and_reactions/posts_and_comments.html to.
+    chats : int
+        Number of conversations.
+    messages : int
+        Number of messages per conversation.
+    senders : int
+        Number of participants per conversation, including the owner of the export.
+    years : int
+        Number of years, ending in 2018, the messages and reactions are spread over.
+    reactions : int
+        Number of likes and reactions.
+    seed : int
+        Seed of the random generator, the same arguments always give the same export.
+    """
+    rng = random.Random(seed)
+    names = ["{} {}".format(first, last) for last in LAST_NAMES for first in FIRST_NAMES]
+    start = datetime.datetime(2018 - years + 1, 1, 1)
+    minutes = int((datetime.datetime(2019, 1, 1) - start).total_seconds() // 60)
+
+    inbox_path = os.path.join(data_path, "messages", "inbox")
+    for chat in range(chats):
+        friend = names[chat % len(names)]
+        participants = [OWNER, friend] + rng.sample(names, max(senders - 2, 0))
+        directory = "{}_{:010x}".format(friend.replace(" ", "").lower(), rng.getrandbits(40))
+        chat_path = os.path.join(inbox_path, directory)
+        os.makedirs(chat_path, exist_ok=True)
+        times = sorted((rng.randrange(minutes) for _ in range(messages)), reverse=True)
+        with open(os.path.join(chat_path, "message.html"), 'w', encoding='utf-8') as html_file:
+            html_file.write(HEADER.format(html.escape(friend)))
+            for minute in times:
+                html_file.write(BLOCK)
+                html_file.write('<div class="_3-96 _2pio _2lek _2lel">{}</div>'.format(
+                    html.escape(rng.choice(participants[:senders]))))
+                html_file.write('<div class="_3-96 _2let"><div><div></div><div>{}</div><div></div><div></div>'
+                                '</div></div>'.format(html.escape(_sentence(rng))))
+                html_file.write('<div class="_3-94 _2lem">{}</div></div>'.format(
+                    _format_time(start, minute)))
+            html_file.write(FOOTER)
+
+    likes_path = os.path.join(data_path, "likes_and_reactions")
+    os.makedirs(likes_path, exist_ok=True)
+    posters = names[:max(chats, 20)] + ["Some Page {}".format(page) for page in range(20)]
+    times = sorted((rng.randrange(minutes) for _ in range(reactions)), reverse=True)
+    with open(os.path.join(likes_path, "posts_and_comments.html"), 'w', encoding='utf-8') as html_file:
+        html_file.write(HEADER.format("Posts and Comments"))
+        for minute in times:
+            reaction = rng.choice(REACTIONS)
+            verb = "likes" if reaction == "like" else "reacted to"
+            html_file.write(BLOCK)
+            html_file.write('<div class="_3-96 _2pio _2lek _2lel">{} {} {}&#039;s post.</div>'.format(
+                OWNER, verb, html.escape(rng.choice(posters))))
+            html_file.write('<div class="_3-96 _2let"><div><div class="_2pin"><img src="../../icons/{}.png" />'
+                            '</div></div></div>'.format(reaction))
+            html_file.write('<div class="_3-94 _2lem">{}</div></div>'.format(_format_time(start, minute)))
+        html_file.write(FOOTER)
+
+
+def _sentence(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 12)))
+
+
+def _format_time(start, minute):
+    time = start + datetime.timedelta(minutes=minute)
+    return "{:02d} {} {} {:02d}:{:02d}".format(time.day, MONTH_NAMES[time.month - 1], time.year, time.hour,
+                                              time.minute)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', type=str, help='directory to write the synthetic export to.')
+    parser.add_argument('--chats', type=int, default=10, help='number of conversations.')
+    parser.add_argument('--messages', type=int, default=1000, help='number of messages per conversation.')
+    parser.add_argument('--senders', type=int, default=3, help='number of participants per conversation.')
+    parser.add_argument('--years', type=int, default=3, help='number of years the data is spread over.')
+    parser.add_argument('--reactions', type=int, default=1000, help='number of likes and reactions.')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random generator.')
+    args = parser.parse_args()
+    generate(args.path, chats=args.chats, messages=args.messages, senders=args.senders, years=args.years,
+             reactions=args.reactions, seed=args.seed)
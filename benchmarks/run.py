@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import matplotlib
+matplotlib.use("Agg")
+
+from benchmarks.generate import OWNER, generate
+from insights import likes_and_reactions, messages, parser
+
+
+SCALES = {
+    "small": dict(chats=5, messages=2000, senders=3, years=2, reactions=2000),
+    "medium": dict(chats=20, messages=10000, senders=4, years=4, reactions=20000),
+    "large": dict(chats=50, messages=40000, senders=6, years=8, reactions=100000),
+}
+
+
+def run(scales=("small",), output=None, repeat=1, memory=True, work_path=None):
+    """
+    Time every stage of the pipeline on synthetic exports of the given scales.
+
+    Every stage is run repeat times and the fastest run is reported. The peak
+    memory is measured in one extra run with tracemalloc, which only sees memory
+    allocated through Python (including numpy and pandas buffers).
+
+    Parameters
+    ----------
+    scales : iterable of str
+        Names of the scales in SCALES to run.
+    output : str or None, optional
+        Path of the JSON file to write the results to.
+    repeat : int, default 1
+        Number of timed runs per stage.
+    memory : bool, default True
+        Measure the peak memory of every stage.
+    work_path : str or None, optional
+        Directory to generate the exports in, a temporary directory if None.
+
+    Returns
+    -------
+    dict
+        Environment description and a list of results with scale, stage,
+        seconds, peak_memory_mb and rows.
+    """
+    results = []
+    for scale in scales:
+        data_path = tempfile.mkdtemp(prefix="insights_" + scale + "_", dir=work_path)
+        try:
+            print("Generating {} export: {}".format(scale, SCALES[scale]))
+            generate(data_path, **SCALES[scale])
+            for stage, function, rows in _stages(data_path):
+                seconds = min(_timed(function) for _ in range(repeat))
+                peak = _peak_memory(function) if memory else None
+                result = dict(scale=scale, stage=stage, seconds=seconds, peak_memory_mb=peak, rows=rows())
+                results.append(result)
+                print("{:<8} {:<36} {:>9.3f}s {:>10} {:>10} rows".format(
+                    scale, stage, seconds, "-" if peak is None else "{:.1f} MB".format(peak), result['rows']))
+        finally:
+            shutil.rmtree(data_path, ignore_errors=True)
+
+    benchmark = dict(timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"), commit=_commit(), environment=_environment(),
+                     scales={scale: SCALES[scale] for scale in scales}, repeat=repeat, results=results)
+    if output is not None:
+        with open(output, 'w') as json_file:
+            json.dump(benchmark, json_file, indent=2)
+    return benchmark
+
+
+def _stages(data_path):
+    """
+    (name, function, rows) of every benchmarked stage, in an order where each
+    stage finds the output of the previous ones on disk.
+    """
+    inbox_path = os.path.join(data_path, "messages", "inbox")
+    conversation = sorted(os.listdir(inbox_path))[0]
+    likes_csv_path = os.path.join(data_path, "likes_and_reactions", "posts_and_comments.csv")
+
+    def message_rows():
+        return int(messages.aggregates.load_counts(data_path)['count'].sum())
+
+    def conversation_rows():
+        counts = messages.aggregates.load_counts(data_path, chats=[conversation])
+        return int(counts['count'].sum())
+
+    def like_rows():
+        with open(likes_csv_path) as csv_file:
+            return sum(1 for _ in csv_file) - 1
+
+    return [
+        ("parser.messages", lambda: parser.messages(data_path, force=True), message_rows),
+        ("parser.messages_streaming", lambda: parser.messages(data_path, streaming=True, force=True), message_rows),
+        ("parser.likes_and_reactions", lambda: parser.likes_and_reactions(data_path), like_rows),
+        ("parser.likes_and_reactions_streaming", lambda: parser.likes_and_reactions(data_path, streaming=True),
+         like_rows),
+        ("load_messages", lambda: messages.load_messages(data_path, cache=False), message_rows),
+        ("load_messages_lean", lambda: messages.load_messages(data_path, cache=False, lean=True), message_rows),
+        ("load_likes", lambda: likes_and_reactions.load_likes(data_path), like_rows),
+        ("plot_messages", lambda: messages.plot_messages(data_path, conversation), conversation_rows),
+        ("plot_amount_messages", lambda: messages.plot_amount_messages(data_path, conversation), conversation_rows),
+        ("message_activity_hourly", lambda: messages.message_activity_hourly(data_path, OWNER), message_rows),
+        ("message_activity_weekly", lambda: messages.message_activity_weekly(data_path, OWNER), message_rows),
+        ("most_active_chat", lambda: messages.most_active_chat(data_path), message_rows),
+        ("like_statistics", lambda: likes_and_reactions.like_statistics(data_path), like_rows),
+        ("like_statistics_yearly", lambda: likes_and_reactions.like_statistics(data_path, yearly=True), like_rows),
+    ]
+
+
+def _timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def _peak_memory(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def _commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _environment():
+    import numpy
+    import pandas
+    return dict(python=platform.python_version(), platform=platform.platform(), numpy=numpy.__version__,
+                pandas=pandas.__version__, matplotlib=matplotlib.__version__)
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser()
+    argument_parser.add_argument('--scales', nargs='+', default=["small"], choices=sorted(SCALES),
+                                 help='scales of the synthetic exports to benchmark.')
+    argument_parser.add_argument('--output', '-o', type=str, default=None,
+                                 help='JSON file to write the results to.')
+    argument_parser.add_argument('--repeat', type=int, default=1,
+                                 help='number of timed runs per stage, the fastest is reported.')
+    argument_parser.add_argument('--no-memory', action='store_true',
+                                 help='do not measure the peak memory of every stage.')
+    argument_parser.add_argument('--work-path', type=str, default=None,
+                                 help='directory to generate the exports in.')
+    args = argument_parser.parse_args()
+    run(scales=args.scales, output=args.output, repeat=args.repeat, memory=not args.no_memory,
+        work_path=args.work_path)
@@ -0,0 +1,112 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+COMMANDS = [
+    ("python", [sys.executable, "-c", "pass"]),
+    ("import insights.parser", [sys.executable, "-c", "import insights.parser"]),
+    ("import insights.messages", [sys.executable, "-c", "import insights.messages"]),
+    ("import insights.search", [sys.executable, "-c", "import insights.search"]),
+    ("python -m insights --help", [sys.executable, "-m", "insights", "--help"]),
+    ("python -m insights.parser --help", [sys.executable, "-m", "insights.parser", "--help"]),
+    ("python -m insights.report --help", [sys.executable, "-m", "insights.report", "--help"]),
+]
+
+
+def run(repeat=10, output=None, baseline=None):
+    """
+    Time cold starts of the command line entry points and module imports.
+
+    Every command runs repeat times in a fresh interpreter, the fastest and the
+    median wall time are reported.
+
+    Parameters
+    ----------
+    baseline : str or None, optional
+        Git ref to compare with, e.g. a commit before an optimization. It is
+        checked out in a temporary worktree and every command is timed there
+        too, right after the current tree so both run under similar load.
+
+    Returns
+    -------
+    dict
+        Environment description and a list of results with command, min_seconds
+        and median_seconds, and baseline_min_seconds and baseline_median_seconds
+        if a baseline was given.
+    """
+    root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    roots = [("", root_path)]
+    baseline_path = None
+    if baseline is not None:
+        baseline_path = tempfile.mkdtemp(prefix="insights_baseline_")
+        subprocess.run(["git", "worktree", "add", "--detach", baseline_path, baseline], cwd=root_path,
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        roots.append(("baseline_", baseline_path))
+        print("{:<36} {:>19} {:>19}".format("", "current min/median", baseline + " min/median"))
+
+    results = []
+    try:
+        for name, command in COMMANDS:
+            result = dict(command=name)
+            for prefix, path in roots:
+                timings = _time_command(command, path, repeat)
+                result[prefix + "min_seconds"] = min(timings) if timings else None
+                result[prefix + "median_seconds"] = statistics.median(timings) if timings else None
+            results.append(result)
+            print("{:<36}".format(name) + "".join(_format_timing(result, prefix) for prefix, _ in roots))
+    finally:
+        if baseline_path is not None:
+            subprocess.run(["git", "worktree", "remove", "--force", baseline_path], cwd=root_path,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            shutil.rmtree(baseline_path, ignore_errors=True)
+
+    benchmark = dict(timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"), python=platform.python_version(),
+                     platform=platform.platform(), repeat=repeat, results=results)
+    if baseline is not None:
+        benchmark['baseline'] = baseline
+    if output is not None:
+        with open(output, 'w') as json_file:
+            json.dump(benchmark, json_file, indent=2)
+    return benchmark
+
+
+def _time_command(command, path, repeat):
+    """
+    Wall times of repeat cold runs of command with path on PYTHONPATH, empty if it fails.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [path, os.environ.get("PYTHONPATH")])))
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run(command, env=env, cwd=path, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL)
+        if completed.returncode != 0:
+            return []
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _format_timing(result, prefix):
+    if result[prefix + "min_seconds"] is None:
+        return " {:>19}".format("FAILED")
+    return " {:>8.3f}s {:>8.3f}s".format(result[prefix + "min_seconds"], result[prefix + "median_seconds"])
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser()
+    argument_parser.add_argument('--repeat', type=int, default=10,
+                                 help='number of cold starts per command.')
+    argument_parser.add_argument('--output', '-o', type=str, default=None,
+                                 help='JSON file to write the results to.')
+    argument_parser.add_argument('--baseline', type=str, default=None,
+                                 help='git ref to compare with, e.g. a commit before an optimization.')
+    args = argument_parser.parse_args()
+    run(repeat=args.repeat, output=args.output, baseline=args.baseline)
@@ -0,0 +1,231 @@
+import argparse
+import os
+
+from insights import parser as parse_command
+from insights import report as report_command
+
+
+def _add_path(parser):
+    parser.add_argument('path', type=str,
+                        help='path to the root directory of the downloaded Facebook data.')
+
+
+def _add_show(parser):
+    parser.add_argument('--show', action='store_true',
+                        help='show the plot in a window as well as saving it.')
+
+
+def _add_chunksize(parser):
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help='without the aggregate cube, stream the messages in chunks of this many rows.')
+
+
+def _plot_messages(args):
+    from insights import messages
+    messages.plot_messages(args.path, args.conversation, start_date=args.days, mode=args.mode, show=args.show)
+
+
+def _plot_amount_messages(args):
+    from insights import messages
+    messages.plot_amount_messages(args.path, args.conversation, start_date=args.days, show=args.show)
+
+
+def _plot_hourly(args):
+    from insights import messages
+    messages.message_activity_hourly(args.path, args.sender, chunksize=args.chunksize, show=args.show)
+
+
+def _plot_weekly(args):
+    from insights import messages
+    messages.message_activity_weekly(args.path, args.sender, chunksize=args.chunksize, show=args.show)
+
+
+def _plot_reply_times(args):
+    from insights import sessions
+    sessions.plot_reply_times(args.path, args.sender, top=args.top, show=args.show)
+
+
+def _plot_initiation_rates(args):
+    from insights import sessions
+    sessions.plot_initiation_rates(args.path, args.sender, top=args.top, gap=args.gap, show=args.show)
+
+
+def _plot_most_active_chat(args):
+    from insights import messages
+    messages.most_active_chat(args.path, start_date=args.days, top=args.top, chunksize=args.chunksize,
+                              show=args.show)
+
+
+def _plot_likes(args):
+    from insights import likes_and_reactions
+    likes_and_reactions.like_statistics(args.path, top=args.top, yearly=args.yearly, fixed_top=args.fixed_top,
+                                        layout=args.layout, messages=args.messages, show=args.show)
+
+
+def _plot_person(args):
+    from insights import people
+    people.plot_person(args.path, args.sender, top=args.top, show=args.show)
+
+
+def _plot_co_occurrence(args):
+    from insights import people
+    people.plot_co_occurrence(args.path, top=args.top, show=args.show)
+
+
+def _plot_term_frequency(args):
+    from insights import search
+    search.plot_term_frequency(args.path, args.query, period=args.period, show=args.show)
+
+
+def _dashboard(args):
+    from insights import dashboard
+    dashboard.dashboard(args.path, sender=args.sender, top=args.top)
+
+
+def _search(args):
+    from insights import search
+    df = search.search(args.path, args.query, chats=args.chat, limit=args.limit)
+    for row in df.itertuples(index=False):
+        print("{:%Y-%m-%d %H:%M} [{}] {}: {}".format(row.time, row.chat, row.sender, row.text))
+
+
+def _person(args):
+    from insights import people
+    summary = people.person(args.path, args.sender)
+    print("{}: {} messages in {} chats on {} days, {:%d %B %Y} to {:%d %B %Y}".format(
+        args.sender, summary['messages'], summary['chats'], summary['active_days'], summary['first_seen'],
+        summary['last_seen']))
+    print("\nChats:")
+    for row in people.chats(args.path, args.sender).head(args.top).itertuples(index=False):
+        print("  {:<40} {:>8} {:%Y-%m-%d} - {:%Y-%m-%d}".format(row.chat, row.messages, row.first_seen,
+                                                                row.last_seen))
+    print("\nContacts:")
+    for name, row in people.contacts(args.path, args.sender, top=args.top).iterrows():
+        print("  {:<40} {:>8} in {} shared chats".format(name, row['messages'], row['shared_chats']))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m insights",
+                                     description="Insights into your personal Facebook data.")
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    command = commands.add_parser('parse', help='parse the html or json export to csv or the store.')
+    parse_command.add_arguments(command)
+    command.set_defaults(run=parse_command.main)
+
+    command = commands.add_parser('report', help='render every plot.')
+    report_command.add_arguments(command)
+    command.set_defaults(run=report_command.main)
+
+    command = commands.add_parser('dashboard', help='write a single html page with zoomable charts.')
+    _add_path(command)
+    command.add_argument('--sender', type=str, default=None, help='your own name, used for the activity charts.')
+    command.add_argument('--top', type=int, default=50, help='number of most active chats to include.')
+    command.set_defaults(run=_dashboard)
+
+    command = commands.add_parser('search', help='print the messages matching a full-text query.')
+    _add_path(command)
+    command.add_argument('query', type=str, help='words, "a phrase", prefix* or a combination with AND/OR/NOT.')
+    command.add_argument('--chat', action='append', default=None,
+                         help='only search this conversation directory, can be repeated.')
+    command.add_argument('--limit', type=int, default=20, help='number of most recent matches to print.')
+    command.set_defaults(run=_search)
+
+    command = commands.add_parser('person', help='print the chats and contacts of a person.')
+    _add_path(command)
+    command.add_argument('sender', type=str, help='name of the person.')
+    command.add_argument('--top', type=int, default=10, help='number of chats and contacts to print.')
+    command.set_defaults(run=_person)
+
+    plot = commands.add_parser('plot', help='render a single plot.')
+    plots = plot.add_subparsers(dest='plot', metavar='plot')
+    plots.required = True
+
+    command = plots.add_parser('messages', help='every message of a conversation by time of day.')
+    _add_path(command)
+    command.add_argument('conversation', type=str, help='name of the conversation directory.')
+    command.add_argument('--days', type=int, default=30, help='number of days to include.')
+    command.add_argument('--mode', choices=['auto', 'scatter', 'heatmap'], default='auto',
+                         help='draw every message or a density heatmap.')
+    command.set_defaults(run=_plot_messages)
+
+    command = plots.add_parser('amount-messages', help='number of messages per day of a conversation.')
+    _add_path(command)
+    command.add_argument('conversation', type=str, help='name of the conversation directory.')
+    command.add_argument('--days', type=int, default=30, help='number of days to include.')
+    command.set_defaults(run=_plot_amount_messages)
+
+    for name, run, description in [('hourly', _plot_hourly, 'messages sent per hour of the day.'),
+                                   ('weekly', _plot_weekly, 'messages sent per day of the week.')]:
+        command = plots.add_parser(name, help=description)
+        _add_path(command)
+        command.add_argument('sender', type=str, help='name of the sender, usually your own.')
+        _add_chunksize(command)
+        command.set_defaults(run=run)
+
+    command = plots.add_parser('reply-times', help='median reply time of a sender and the others per chat.')
+    _add_path(command)
+    command.add_argument('sender', type=str, help='name of the sender, usually your own.')
+    command.add_argument('--top', type=int, default=20, help='number of most active chats to show.')
+    command.set_defaults(run=_plot_reply_times)
+
+    command = plots.add_parser('initiation', help='share of conversation sessions started by a sender per chat.')
+    _add_path(command)
+    command.add_argument('sender', type=str, help='name of the sender, usually your own.')
+    command.add_argument('--top', type=int, default=20, help='number of most active chats to show.')
+    command.add_argument('--gap', type=int, default=60, help='minutes of inactivity that end a session.')
+    command.set_defaults(run=_plot_initiation_rates)
+
+    command = plots.add_parser('most-active-chat', help='most active chats of every day.')
+    _add_path(command)
+    command.add_argument('--days', type=int, default=30, help='number of days to include.')
+    command.add_argument('--top', type=int, default=1, help='number of chats to show per day.')
+    _add_chunksize(command)
+    command.set_defaults(run=_plot_most_active_chat)
+
+    command = plots.add_parser('likes', help='friends and pages whose posts you liked most.')
+    _add_path(command)
+    command.add_argument('--top', type=int, default=20, help='number of friends or pages to show.')
+    command.add_argument('--yearly', action='store_true', help='count the likes per year.')
+    command.add_argument('--fixed-top', action='store_true',
+                         help='use the overall top friends or pages for every year.')
+    command.add_argument('--layout', choices=['rows', 'grid', 'heatmap'], default='rows',
+                         help='layout of the yearly counts.')
+    command.add_argument('--messages', action='store_true',
+                         help='draw the messages of every friend next to their likes.')
+    command.set_defaults(run=_plot_likes)
+
+    command = plots.add_parser('person', help='messages of a person per month and per chat.')
+    _add_path(command)
+    command.add_argument('sender', type=str, help='name of the person.')
+    command.add_argument('--top', type=int, default=15, help='number of chats to show.')
+    command.set_defaults(run=_plot_person)
+
+    command = plots.add_parser('co-occurrence', help='number of chats the most active people share.')
+    _add_path(command)
+    command.add_argument('--top', type=int, default=20, help='number of people to show.')
+    command.set_defaults(run=_plot_co_occurrence)
+
+    command = plots.add_parser('term-frequency', help='use of a word or phrase over time per chat.')
+    _add_path(command)
+    command.add_argument('query', type=str, help='words, "a phrase", prefix* or a combination with AND/OR/NOT.')
+    command.add_argument('--period', choices=['year', 'month', 'day'], default='month',
+                         help='length of the periods matches are counted in.')
+    command.set_defaults(run=_plot_term_frequency)
+
+    for command in plots.choices.values():
+        _add_show(command)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not getattr(args, 'show', False):
+        # Render headless, matplotlib picks this up when it is first imported.
+        os.environ.setdefault("MPLBACKEND", "Agg")
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+import csv
+import datetime
+import os
+
+from insights import instrument
+
+
+COUNTS_NAME = "message_counts.csv"
+CUBE_NAME = "messages/message_counts.csv"
+PEOPLE_NAME = "messages/people.csv"
+PEOPLE_DAILY_NAME = "messages/people_daily.csv"
+CHUNK_SIZE = 100000
+KEYS = ['date', 'chat', 'sender', 'hour']
+
+_memory_cache = {}
+
+
+def count_rows(rows, counter):
+    """
+    Pass parser rows through while counting them per (date, sender, hour) in counter.
+    """
+    for row in rows:
+        time_text, sender = row[0], row[1]
+        date_text, hour_minute = time_text.rsplit(" ", 1)
+        counter[(date_text, sender, int(hour_minute.split(":")[0]))] += 1
+        yield row
+
+
+def write_conversation_counts(conversation_path, counter):
+    """
+    Write the counts gathered by count_rows to message_counts.csv in the conversation directory.
+    """
+    dates = {}
+    for date_text in set(key[0] for key in counter):
+        dates[date_text] = datetime.datetime.strptime(date_text, "%d %B %Y").date().isoformat()
+    counts_path = os.path.join(conversation_path, COUNTS_NAME)
+    tmp_path = counts_path + ".tmp"
+    with open(tmp_path, 'w') as csv_file:
+        writer = csv.writer(csv_file, delimiter=",")
+        writer.writerow(['date', 'sender', 'hour', 'count'])
+        for (date_text, sender, hour), count in sorted(counter.items()):
+            writer.writerow([dates[date_text], sender, hour, count])
+    os.replace(tmp_path, counts_path)
+
+
+def build_cube(data_path, conversations):
+    """
+    Combine the per-conversation counts into messages/message_counts.csv.
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the root directory of your personal facebook data.
+    conversations : list of str
+        Names of the conversation directories in messages/inbox to include.
+    """
+    path = os.path.join(data_path, "messages/inbox")
+    cube_path = os.path.join(data_path, CUBE_NAME)
+    tmp_path = cube_path + ".tmp"
+    with open(tmp_path, 'w') as cube_file:
+        writer = csv.writer(cube_file, delimiter=",")
+        writer.writerow(['date', 'chat', 'sender', 'hour', 'count'])
+        for conversation in sorted(conversations):
+            counts_path = os.path.join(path, conversation, COUNTS_NAME)
+            if not os.path.isfile(counts_path):
+                continue
+            with open(counts_path) as counts_file:
+                reader = csv.reader(counts_file, delimiter=",")
+                next(reader)
+                for date, sender, hour, count in reader:
+                    writer.writerow([date, conversation, sender, hour, count])
+    os.replace(tmp_path, cube_path)
+
+
+def build_people(data_path):
+    """
+    Derive the person index from the cube, see `insights.people`.
+
+    Writes messages/people.csv, with the messages, first and last date of every
+    sender in every chat they wrote in, i.e. the sender by chat graph, and
+    messages/people_daily.csv with the messages of every sender per day over
+    all chats.
+    """
+    chats = {}
+    daily = {}
+    with open(os.path.join(data_path, CUBE_NAME)) as cube_file:
+        reader = csv.reader(cube_file, delimiter=",")
+        next(reader)
+        for date, chat, sender, hour, count in reader:
+            count = int(count)
+            entry = chats.get((sender, chat))
+            if entry is None:
+                chats[(sender, chat)] = [count, date, date]
+            else:
+                entry[0] += count
+                entry[1] = min(entry[1], date)
+                entry[2] = max(entry[2], date)
+            daily[(sender, date)] = daily.get((sender, date), 0) + count
+
+    rows = sorted(((sender, -entry[0], chat), entry) for (sender, chat), entry in chats.items())
+    _write_csv(os.path.join(data_path, PEOPLE_NAME), ['sender', 'chat', 'messages', 'first_seen', 'last_seen'],
+               ([sender, chat] + entry for (sender, _, chat), entry in rows))
+    _write_csv(os.path.join(data_path, PEOPLE_DAILY_NAME), ['sender', 'date', 'count'],
+               ([sender, date, count] for (sender, date), count in sorted(daily.items())))
+
+
+def _write_csv(csv_path, header, rows):
+    tmp_path = csv_path + ".tmp"
+    with open(tmp_path, 'w') as csv_file:
+        writer = csv.writer(csv_file, delimiter=",")
+        writer.writerow(header)
+        writer.writerows(rows)
+    os.replace(tmp_path, csv_path)
+
+
+@instrument.instrumented("aggregates.count_messages")
+def count_messages(df):
+    """
+    Aggregate raw messages as returned by load_messages to the same shape as the cube.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns date, chat and sender (if df has them), hour and count.
+    """
+    instrument.add_rows(len(df))
+    return _count(df)
+
+
+def _count(df):
+    keys = [df['time'].dt.normalize().rename('date')]
+    keys.extend(df[column] for column in ['chat', 'sender'] if column in df.columns)
+    keys.append(df['time'].dt.hour.rename('hour'))
+    counts = df.groupby(keys, observed=True, sort=False).size()
+    return counts.reset_index(name='count')
+
+
+@instrument.instrumented("aggregates.stream_counts")
+def stream_counts(data_path, chats=None, senders=None, chunksize=CHUNK_SIZE):
+    """
+    Count the messages per date, chat, sender and hour without loading them all.
+
+    The message.csv files, or the store, are read in chunks of chunksize rows.
+    Every chunk is reduced to its counts and the partial counts are folded into
+    the running totals whenever they grow past the size of the totals, so memory
+    is bounded by the chunk size and the number of distinct (date, chat, sender,
+    hour) keys rather than by the number of messages.
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the root directory of your personal facebook data.
+    chats : list of str or None, optional
+        Names of the conversation directories to count, all if None.
+    senders : list of str or None, optional
+        Only count the messages of these senders.
+    chunksize : int, default CHUNK_SIZE
+        Number of messages read at a time.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns date, chat, sender, hour and count, like `load_counts`.
+    """
+    import pandas as pd
+
+    partials = []
+    rows = 0
+    limit = chunksize
+    for chunk in _iter_chunks(data_path, chats, chunksize):
+        instrument.add_rows(len(chunk))
+        if senders is not None:
+            chunk = chunk[chunk['sender'].isin(senders)]
+        partial = _count(chunk[['time', 'chat', 'sender']])
+        partials.append(partial)
+        rows += len(partial)
+        if rows > limit:
+            partials = [_fold(partials)]
+            rows = len(partials[0])
+            limit = max(chunksize, 2 * rows)
+    if not partials:
+        return pd.DataFrame({'date': pd.Series(dtype='datetime64[ns]'), 'chat': pd.Categorical([]),
+                             'sender': pd.Categorical([]), 'hour': pd.Series(dtype='int8'),
+                             'count': pd.Series(dtype='int32')})
+    counts = _fold(partials)
+    for column in ['chat', 'sender']:
+        counts[column] = counts[column].astype('category')
+    return counts
+
+
+def _fold(partials):
+    import pandas as pd
+
+    counts = pd.concat(partials, ignore_index=True)
+    return counts.groupby(KEYS, observed=True, sort=False)['count'].sum().reset_index()
+
+
+def _iter_chunks(data_path, chats, chunksize):
+    """
+    Frames with columns time (datetime64), sender and chat of at most chunksize messages.
+    """
+    import pandas as pd
+    from insights import files, store
+    from insights.utils import parse_time
+
+    if store.exists(data_path):
+        for chunk in store.iter_batches(data_path, chats=chats, columns=['time', 'sender', 'chat'],
+                                        batch_size=chunksize):
+            yield chunk
+        return
+
+    path = os.path.join(data_path, "messages/inbox")
+    listing = files.scan(path)
+    for directory in (sorted(listing) if chats is None else chats):
+        if "message.csv" not in listing.get(directory, {}):
+            continue
+        csv_path = os.path.join(path, directory, "message.csv")
+        for chunk in pd.read_csv(csv_path, usecols=['time', 'sender'], chunksize=chunksize):
+            chunk['time'] = parse_time(chunk['time'])
+            chunk['chat'] = directory
+            yield chunk
+
+
+def load_counts(data_path, chats=None):
+    """
+    Load the daily aggregate cube written by the parser.
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the root directory of your personal facebook data.
+    chats : list of str or None, optional
+        Names of the conversation directories to return, all if None.
+
+    Returns
+    -------
+    pandas.DataFrame or None
+        Number of messages per date, chat, sender and hour, None if the parser did
+        not write the cube.
+    """
+    cube = _load_cube(data_path)
+    if cube is None:
+        return None
+    counts = cube['counts']
+    if chats is None:
+        return counts.copy()
+    counts = counts[counts['chat'].isin(chats)].copy()
+    for column in ['chat', 'sender']:
+        counts[column] = counts[column].cat.remove_unused_categories()
+    return counts
+
+
+def chat_totals(data_path, start_date, end_date):
+    """
+    Number of messages of every chat between start_date and end_date (inclusive).
+
+    Uses the per-chat prefix sums of the cube, built on the first call and kept
+    with the memoized cube, so the cost does not depend on the length of the
+    date range or the number of messages.
+
+    Returns
+    -------
+    pandas.Series or None
+        Messages per chat, None if the parser did not write the cube.
+    """
+    import numpy as np
+    import pandas as pd
+
+    cube = _load_cube(data_path)
+    if cube is None:
+        return None
+    if 'prefix' not in cube:
+        # prefix[i, c] is the number of messages of chat c before dates[i].
+        daily = cube['counts'].pivot_table(index='date', columns='chat', values='count', aggfunc='sum',
+                                           fill_value=0, observed=True)
+        prefix = np.zeros((len(daily) + 1, daily.shape[1]), dtype=np.int64)
+        np.cumsum(daily.values, axis=0, out=prefix[1:])
+        cube.update(dates=daily.index, chats=daily.columns.astype(str), prefix=prefix)
+    dates, prefix = cube['dates'], cube['prefix']
+    start = dates.searchsorted(pd.Timestamp(start_date).normalize(), side='left')
+    end = dates.searchsorted(pd.Timestamp(end_date).normalize(), side='right')
+    return pd.Series(prefix[end] - prefix[start], index=cube['chats'], name='count')
+
+
+@instrument.instrumented("aggregates.load_cube")
+def _load_cube(data_path):
+    import numpy as np
+    import pandas as pd
+
+    cube_path = os.path.join(data_path, CUBE_NAME)
+    if not os.path.isfile(cube_path):
+        return None
+    key = os.path.abspath(cube_path)
+    mtime = os.stat(cube_path).st_mtime_ns
+    cached = _memory_cache.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    counts = pd.read_csv(cube_path, dtype={'chat': 'category', 'sender': 'category', 'hour': np.int8,
+                                           'count': np.int32},
+                         keep_default_na=False)
+    counts['date'] = pd.to_datetime(counts['date'], format="%Y-%m-%d")
+    cube = {'counts': counts}
+    _memory_cache[key] = (mtime, cube)
+    return cube
@@ -0,0 +1,119 @@
+import io
+import os
+import posixpath
+import re
+import zipfile
+import zlib
+from collections import namedtuple
+
+
+ROOT_PATTERN = re.compile(r"^(?:.*?/)?((?:messages|likes_and_reactions)/.*)$")
+
+Member = namedtuple("Member", ["zip_path", "name"])
+
+_zip_files = {}
+
+
+def members(zip_paths):
+    """
+    Index the members of one or more parts of an export download.
+
+    Large downloads are split in several complete zip files that each hold part
+    of the tree, so the parts are combined in one index. Members are keyed on
+    their path relative to the root of the export, e.g.
+    "messages/inbox/john_abc/message.html", whatever directory they are nested
+    in inside the zip file. Only the central directory of every part is read.
+
+    Parameters
+    ----------
+    zip_paths : list of str
+        Paths of the zip files.
+
+    Returns
+    -------
+    dict
+        Relative path to the Member (zip file and member name) holding it.
+    """
+    index = {}
+    for zip_path in zip_paths:
+        for info in _zip_file(zip_path).infolist():
+            if info.is_dir():
+                continue
+            match = ROOT_PATTERN.match(info.filename)
+            if match:
+                index[match.group(1)] = Member(zip_path, info.filename)
+    return index
+
+
+def conversations(index):
+    """
+    Source members of every conversation in the index.
+
+    Returns
+    -------
+    dict
+        Conversation directory name to a list of Members: message.html for the
+        html export, otherwise the message.json or message_1.json, ... parts in
+        export order.
+    """
+    from insights.json_reader import MESSAGE_FILE_PATTERN
+
+    files = {}
+    for path, member in index.items():
+        parts = path.split("/")
+        if len(parts) == 4 and parts[:2] == ["messages", "inbox"]:
+            files.setdefault(parts[2], {})[parts[3]] = member
+    sources = {}
+    for conversation, names in files.items():
+        if "message.html" in names:
+            sources[conversation] = [names["message.html"]]
+            continue
+        json_parts = []
+        for name, member in names.items():
+            match = MESSAGE_FILE_PATTERN.match(name)
+            if match:
+                json_parts.append((int(match.group(1) or 0), member))
+        if json_parts:
+            sources[conversation] = [member for _, member in sorted(json_parts)]
+    return sources
+
+
+def open_member(member, binary=False):
+    """
+    Open a member for reading, decompressing it while it is read.
+    """
+    member_file = _zip_file(member.zip_path).open(member.name)
+    if binary:
+        return member_file
+    return io.TextIOWrapper(member_file, encoding="utf-8")
+
+
+def source_entry(sources):
+    """
+    Manifest entry of archive members: total size, latest modification time and
+    a combined checksum of the CRC-32 values stored in the zip files, so the
+    members do not have to be decompressed to detect changes.
+    """
+    size = 0
+    mtime = None
+    checksum = 0
+    for member in sources:
+        info = _zip_file(member.zip_path).getinfo(member.name)
+        size += info.file_size
+        mtime = max(mtime, info.date_time) if mtime is not None else info.date_time
+        checksum = zlib.crc32("{}:{:08x};".format(posixpath.basename(member.name), info.CRC).encode(), checksum)
+    return {"size": size, "mtime": "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(*mtime),
+            "crc32": "{:08x}".format(checksum)}
+
+
+def _zip_file(zip_path):
+    """
+    Opened zip file, kept open for the lifetime of the process so its central
+    directory is only read once per (worker) process. Forked workers do not
+    reuse the handles of their parent as they would share its file offset.
+    """
+    key = (os.getpid(), os.path.abspath(zip_path))
+    zip_file = _zip_files.get(key)
+    if zip_file is None:
+        zip_file = _zip_files[key] = zipfile.ZipFile(zip_path)
+    return zip_file
@@ -0,0 +1,174 @@
+import datetime
+import json
+import os
+
+from insights import instrument
+import numpy as np
+import pandas as pd
+
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dashboard.html")
+RESOLUTIONS = ["day", "week", "month"]
+TOP_SENDERS = 4
+
+
+@instrument.instrumented("dashboard")
+def dashboard(data_path, sender=None, top=50, df=None, likes_df=None):
+    """
+    Write output/dashboard.html, a single static page with zoomable charts of
+    the conversations, your activity and your likes.
+
+    The messages are aggregated once and embedded as JSON bucketed per day,
+    week and month. The page draws the resolution that fits the visible range,
+    so its size and render time depend on the number of active days rather
+    than on the number of messages, and it needs no server or network access.
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the root directory of your personal facebook data.
+    sender : str or None, optional
+        Name used for the activity charts. Recommended to be your own name. If
+        None, the activity of everyone is shown.
+    top : int, default 50
+        Number of chats with the most messages that get their own chart, the
+        other chats are combined in one.
+    df : pandas.DataFrame or None, optional
+        Messages of all conversations as returned by `load_messages`. If None,
+        the aggregate cube written by the parser is used when present, otherwise
+        the messages are loaded from data_path.
+    likes_df : pandas.DataFrame or None, optional
+        Likes as returned by `load_likes`. If None, they are loaded from
+        data_path when the likes were parsed.
+
+    Returns
+    -------
+    str
+        Path of the written html file.
+    """
+    from insights.messages import _chat_labels, _message_counts
+
+    counts = _message_counts(data_path, df)
+    instrument.add_rows(len(counts))
+    counts = pd.DataFrame({'day': counts['date'].values.astype('datetime64[D]').astype(np.int64),
+                           'chat': counts['chat'].astype(str).values,
+                           'sender': counts['sender'].astype(str).values,
+                           'hour': counts['hour'].values.astype(np.int64),
+                           'count': counts['count'].values.astype(np.int64)})
+    for resolution in RESOLUTIONS:
+        counts[resolution] = _bucket_starts(counts['day'].values, resolution)
+
+    data = {
+        'generated': datetime.datetime.now().strftime("%d %B %Y %H:%M"),
+        'chats': _chat_data(counts, top, _chat_labels),
+        'activity': _activity_data(counts, sender),
+        'likes': _likes_data(data_path, likes_df),
+    }
+
+    with open(TEMPLATE_PATH) as template_file:
+        template = template_file.read()
+    # Keep the json from closing the script element it is embedded in.
+    payload = json.dumps(data, separators=(',', ':')).replace("</", "<\\/")
+
+    output_path = os.path.join(data_path, "output")
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+    file_name = os.path.join(output_path, "dashboard.html")
+    tmp_path = file_name + ".tmp"
+    with open(tmp_path, 'w') as html_file:
+        html_file.write(template.replace("__DATA__", payload))
+    os.replace(tmp_path, file_name)
+    print("Wrote {} ({:.1f} KB).".format(file_name, os.path.getsize(file_name) / 1024.0))
+    return file_name
+
+
+def _bucket_starts(days, resolution):
+    """
+    First day of the day, week (starting on Monday) or month bucket of every
+    day, all as days since 1970-01-01.
+    """
+    if resolution == "day":
+        return days
+    if resolution == "week":
+        # 1970-01-01 was a Thursday.
+        return days - (days + 3) % 7
+    months = days.astype('datetime64[D]').astype('datetime64[M]')
+    return months.astype('datetime64[D]').astype(np.int64)
+
+
+def _series(df):
+    """
+    Messages per bucket of df at every resolution as [[bucket starts], [counts]].
+    """
+    series = {}
+    for resolution in RESOLUTIONS:
+        totals = df.groupby(resolution, sort=True)['count'].sum()
+        series[resolution] = [totals.index.tolist(), totals.values.tolist()]
+    return series
+
+
+def _grouped_series(df, column, names):
+    """
+    Series per resolution with one entry for every name in names, rows of df
+    whose column is not in names go to an extra last entry if there are any.
+    """
+    groups = [df[df[column] == name] for name in names]
+    rest = df[~df[column].isin(names)]
+    if len(rest):
+        groups.append(rest)
+    per_group = [_series(group) for group in groups]
+    return dict((resolution, [series[resolution] for series in per_group]) for resolution in RESOLUTIONS)
+
+
+def _chat_data(counts, top, chat_labels):
+    totals = counts.groupby('chat')['count'].sum().sort_values(ascending=False, kind='mergesort')
+    chats = list(totals.index[:top])
+    labels = chat_labels(chats)
+    grouped = dict(iter(counts.groupby('chat', sort=False)))
+    result = []
+    for chat, label in zip(chats, labels):
+        chat_counts = grouped[chat]
+        senders = chat_counts.groupby('sender')['count'].sum().sort_values(ascending=False, kind='mergesort')
+        names = list(senders.index[:TOP_SENDERS])
+        series = _grouped_series(chat_counts, 'sender', names)
+        if len(series['month']) > len(names):
+            names.append("others")
+        result.append({'name': chat, 'label': label, 'messages': int(totals[chat]), 'senders': names,
+                       'series': series})
+    rest = counts[~counts['chat'].isin(chats)]
+    if len(rest):
+        result.append({'name': "{} other chats".format(len(totals) - len(chats)), 'label': "other chats",
+                       'messages': int(rest['count'].sum()), 'senders': ["all"],
+                       'series': _grouped_series(rest, 'chat', [])})
+    return result
+
+
+def _activity_data(counts, sender):
+    names = [sender] if sender is not None else []
+    series = _grouped_series(counts, 'sender', names)
+    if len(series['month']) > len(names):
+        names.append("others" if sender is not None else "everyone")
+    if sender is not None:
+        counts = counts[counts['sender'] == sender]
+    hourly = np.bincount(counts['hour'].values, weights=counts['count'].values, minlength=24)
+    # 1970-01-01 was a Thursday, day 3 of the week counting from Monday.
+    weekly = np.bincount((counts['day'].values + 3) % 7, weights=counts['count'].values, minlength=7)
+    return {'names': names, 'series': series, 'hourly': hourly.astype(np.int64).tolist(),
+            'weekly': weekly.astype(np.int64).tolist()}
+
+
+def _likes_data(data_path, likes_df, top=20):
+    from insights.likes_and_reactions import _poster_counts, load_likes
+
+    if likes_df is None:
+        if not os.path.isfile(os.path.join(data_path, "likes_and_reactions", "posts_and_comments.csv")):
+            return None
+        likes_df = load_likes(data_path, lean=True)
+    days = likes_df['time'].values.astype('datetime64[D]').astype(np.int64)
+    likes = pd.DataFrame({'count': np.ones(len(days), dtype=np.int64)})
+    for resolution in RESOLUTIONS:
+        likes[resolution] = _bucket_starts(days, resolution)
+    posters = _poster_counts(likes_df).head(top)
+    series = _series(likes)
+    return {'series': dict((resolution, [series[resolution]]) for resolution in RESOLUTIONS),
+            'posters': [[str(name), int(count)] for name, count in posters.items()]}
@@ -0,0 +1,144 @@
+import collections
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from insights import instrument
+
+
+SCAN_WORKERS = 8
+READ_WORKERS = 4
+PREFETCH_DEPTH = 8
+PREFETCH_MAX_BYTES = 16 * 2 ** 20
+
+# A file read ahead by a Prefetcher with its os.stat_result from the listing.
+Loaded = collections.namedtuple("Loaded", ["path", "data", "stat"])
+
+
+def scan(path, workers=SCAN_WORKERS):
+    """
+    List the files of every subdirectory of path, e.g. the conversations of the inbox.
+
+    Uses one os.scandir per directory instead of a listdir followed by isdir,
+    isfile and stat calls per file, and scans the subdirectories concurrently so
+    the round trips overlap on network storage.
+
+    Returns
+    -------
+    dict
+        Subdirectory name to a dict of file name to os.stat_result.
+    """
+    with os.scandir(path) as entries:
+        directories = [entry for entry in entries if entry.is_dir()]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        listings = executor.map(list_files, [entry.path for entry in directories])
+        return dict(zip([entry.name for entry in directories], listings))
+
+
+def list_files(path):
+    """
+    File name to os.stat_result of the files directly in path, empty if path does not exist.
+    """
+    try:
+        with os.scandir(path) as entries:
+            return dict((entry.name, entry.stat()) for entry in entries if entry.is_file())
+    except FileNotFoundError:
+        return {}
+
+
+def walk(path, skip_prefix=None):
+    """
+    (path, os.stat_result) of every file below path.
+
+    Directories whose name starts with skip_prefix are not entered.
+    """
+    files = []
+    stack = [path]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if skip_prefix is None or not entry.name.startswith(skip_prefix):
+                        stack.append(entry.path)
+                elif entry.is_file():
+                    files.append((entry.path, entry.stat()))
+    return files
+
+
+def read_bytes(path):
+    """
+    Content of the file at path, None if it does not exist.
+    """
+    try:
+        with open(path, 'rb') as source_file:
+            return source_file.read()
+    except FileNotFoundError:
+        return None
+
+
+class Prefetcher(object):
+    """
+    Iterate over read(item) for every item while the next items are read in
+    background threads.
+
+    At most depth results are read ahead, so memory stays bounded. The time
+    the consumer waits for a result (I/O wait) and the time it spends between
+    results (compute) are measured and added to the active trace as the stages
+    "<name>.wait" and "<name>.compute".
+
+    Parameters
+    ----------
+    items : iterable
+        Arguments of read, e.g. file paths.
+    read : callable
+        Function that reads a single item, called in a worker thread.
+    name : str, default "io"
+        Prefix of the recorded stages.
+    workers : int, default READ_WORKERS
+        Number of reading threads.
+    depth : int, default PREFETCH_DEPTH
+        Maximum number of items read ahead.
+    """
+
+    def __init__(self, items, read, name="io", workers=READ_WORKERS, depth=PREFETCH_DEPTH):
+        self.items = items
+        self.read = read
+        self.name = name
+        self.workers = workers
+        self.depth = depth
+        self.count = 0
+        self.wait = 0.0
+        self.compute = 0.0
+
+    def __iter__(self):
+        items = iter(self.items)
+        last = None
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                pending = collections.deque()
+                for item in items:
+                    pending.append(executor.submit(self.read, item))
+                    if len(pending) >= self.depth:
+                        break
+                while pending:
+                    start = time.time()
+                    if last is not None:
+                        self.compute += start - last
+                    value = pending.popleft().result()
+                    self.wait += time.time() - start
+                    for item in items:
+                        pending.append(executor.submit(self.read, item))
+                        break
+                    self.count += 1
+                    last = time.time()
+                    yield value
+                if last is not None:
+                    self.compute += time.time() - last
+                    last = None
+        finally:
+            instrument.record(self.name + ".wait", self.wait, rows=self.count)
+            instrument.record(self.name + ".compute", self.compute, rows=self.count)
+
+    def summary(self):
+        return "Read {} items in the background: {:.2f}s waiting for I/O, {:.2f}s computing.".format(
+            self.count, self.wait, self.compute)
@@ -0,0 +1,269 @@
+import re
+from html.parser import HTMLParser
+
+
+BLOCK_CLASS = "pam _3-95 _2pi0 _2lej uiBoxWhite noborder"
+BLOCK_CLASSES = frozenset(BLOCK_CLASS.split())
+SENDER_CLASS = "_3-96 _2pio _2lek _2lel"
+TIME_CLASS = "_3-94 _2lem"
+TEXT_CLASSES = frozenset(["_3-96", "_2let"])
+ICON_CLASS = "_2pin"
+VOID_ELEMENTS = frozenset(["area", "base", "br", "col", "embed", "hr", "img", "input", "keygen",
+                           "link", "menuitem", "meta", "param", "source", "track", "wbr"])
+
+REACTION_PATTERN = re.compile(r"^(.*?)(?: like(?:s|d) | reacted to )(.*?)(?:'s| own)")
+REACTION_ICON_PATTERN = re.compile(r"(\w+)\.png")
+
+CHUNK_SIZE = 1 << 16
+
+
+class _Element(object):
+    __slots__ = ("tag", "class_string", "classes", "captures")
+
+    def __init__(self, tag, class_string):
+        self.tag = tag
+        self.class_string = class_string
+        self.classes = frozenset(class_string.split())
+        self.captures = None
+
+
+class _Block(object):
+    __slots__ = ("depth", "sender", "time", "text", "text_matches", "icon_depth", "icon_src")
+
+    def __init__(self, depth):
+        self.depth = depth
+        self.sender = None
+        self.time = None
+        self.text = None
+        self.text_matches = 0
+        self.icon_depth = None
+        self.icon_src = None
+
+
+class _BlockHTMLParser(HTMLParser):
+    """
+    Incremental tokenizer that reads the export one block div at a time.
+
+    Keeps only the stack of open elements and the block that is currently being
+    read in memory. Subclasses decide where blocks start, what to capture inside
+    them and how to turn a finished block into a row. Finished rows are collected
+    in `rows` and should be drained by the caller after every `feed`.
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.rows = []
+        self._stack = []
+        self._block = None
+        self._active = []
+
+    def handle_starttag(self, tag, attrs):
+        class_string = ""
+        role = None
+        src = None
+        for name, value in attrs:
+            if name == "class":
+                class_string = value or ""
+            elif name == "role":
+                role = value
+            elif name == "src":
+                src = value
+        element = _Element(tag, class_string)
+        depth = len(self._stack)
+        if tag in VOID_ELEMENTS:
+            if self._block is not None:
+                self._void_in_block(self._block, element, src)
+            return
+        self._stack.append(element)
+        if tag != "div":
+            return
+        if self._block is None:
+            if self._starts_block(element, depth):
+                self._block = _Block(depth)
+        else:
+            self._div_in_block(self._block, element, depth)
+        self._div_opened(element, depth, role)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        stack = self._stack
+        for index in range(len(stack) - 1, -1, -1):
+            if stack[index].tag == tag:
+                break
+        else:
+            return
+        while len(stack) > index:
+            element = stack.pop()
+            depth = len(stack)
+            if element.captures:
+                for buffer in element.captures:
+                    self._active.remove(buffer)
+            self._element_closed(element, depth)
+            if self._block is not None and self._block.depth == depth:
+                self.rows.append(self._emit(self._block))
+                self._block = None
+
+    def handle_data(self, data):
+        for buffer in self._active:
+            buffer.append(data)
+
+    def _capture(self, element):
+        buffer = []
+        if element.captures is None:
+            element.captures = []
+        element.captures.append(buffer)
+        self._active.append(buffer)
+        return buffer
+
+    def _starts_block(self, element, depth):
+        raise NotImplementedError
+
+    def _div_in_block(self, block, element, depth):
+        raise NotImplementedError
+
+    def _void_in_block(self, block, element, src):
+        pass
+
+    def _div_opened(self, element, depth, role):
+        pass
+
+    def _element_closed(self, element, depth):
+        pass
+
+    def _emit(self, block):
+        raise NotImplementedError
+
+
+class MessageHTMLParser(_BlockHTMLParser):
+    """
+    Incremental tokenizer for a conversation's message.html.
+
+    Mirrors the selectors used by the BeautifulSoup implementation in parser.py.
+    """
+
+    def __init__(self):
+        _BlockHTMLParser.__init__(self)
+        self._main_depths = []
+
+    def _starts_block(self, element, depth):
+        return bool(self._main_depths) and self._main_depths[-1] == depth - 1 and BLOCK_CLASSES <= element.classes
+
+    def _div_in_block(self, block, element, depth):
+        if block.sender is None and element.class_string == SENDER_CLASS:
+            block.sender = self._capture(element)
+        if block.time is None and element.class_string == TIME_CLASS:
+            block.time = self._capture(element)
+        if (depth >= 2 and self._stack[depth - 1].tag == "div" and self._stack[depth - 2].tag == "div"
+                and TEXT_CLASSES <= self._stack[depth - 2].classes):
+            block.text_matches += 1
+            if block.text_matches == 2:
+                block.text = self._capture(element)
+
+    def _div_opened(self, element, depth, role):
+        if role == "main":
+            self._main_depths.append(depth)
+
+    def _element_closed(self, element, depth):
+        if self._main_depths and self._main_depths[-1] == depth:
+            self._main_depths.pop()
+
+    def _emit(self, block):
+        if block.time is None:
+            raise ValueError("Message block without a timestamp.")
+        sender = "".join(block.sender) if block.sender is not None else "unknown"
+        text = "".join(block.text) if block.text is not None else "unknown"
+        return ["".join(block.time), sender, text]
+
+
+class ReactionHTMLParser(_BlockHTMLParser):
+    """
+    Incremental tokenizer for likes_and_reactions/posts_and_comments.html.
+
+    Every reaction is matched once against REACTION_PATTERN and its icon once
+    against REACTION_ICON_PATTERN.
+    """
+
+    def _starts_block(self, element, depth):
+        return element.class_string == BLOCK_CLASS
+
+    def _div_in_block(self, block, element, depth):
+        if block.sender is None and element.class_string == SENDER_CLASS:
+            block.sender = self._capture(element)
+        if block.time is None and element.class_string == TIME_CLASS:
+            block.time = self._capture(element)
+        if block.icon_depth is None and element.class_string == ICON_CLASS:
+            block.icon_depth = depth
+
+    def _void_in_block(self, block, element, src):
+        if element.tag == "img" and block.icon_src is None and block.icon_depth is not None:
+            block.icon_src = src
+
+    def _element_closed(self, element, depth):
+        block = self._block
+        if block is not None and block.icon_depth == depth and block.icon_src is None:
+            # Only the first icon div counts, like find() in the BeautifulSoup parser.
+            block.icon_depth = -1
+
+    def _emit(self, block):
+        if block.sender is None or block.time is None or block.icon_src is None:
+            raise ValueError("Incomplete reaction block.")
+        match = REACTION_PATTERN.match("".join(block.sender))
+        if match is None:
+            raise ValueError("Unrecognised reaction: {}".format("".join(block.sender)))
+        liker, poster = match.group(1, 2)
+        reaction = REACTION_ICON_PATTERN.search(block.icon_src).group(1)
+        return ["".join(block.time), reaction, liker, poster]
+
+
+def _iter_rows(parser, file):
+    while True:
+        chunk = file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        parser.feed(chunk)
+        if parser.rows:
+            rows = parser.rows
+            parser.rows = []
+            for row in rows:
+                yield row
+    parser.close()
+    for row in parser.rows:
+        yield row
+
+
+def iter_messages(file):
+    """
+    Stream the messages of a conversation's message.html.
+
+    Parameters
+    ----------
+    file : file-like
+        Opened message.html in text mode.
+
+    Yields
+    ------
+    list
+        [time, sender, text] for every message, in document order.
+    """
+    return _iter_rows(MessageHTMLParser(), file)
+
+
+def iter_reactions(file):
+    """
+    Stream the reactions of likes_and_reactions/posts_and_comments.html.
+
+    Parameters
+    ----------
+    file : file-like
+        Opened posts_and_comments.html in text mode.
+
+    Yields
+    ------
+    list
+        [time, reaction, liker, poster] for every reaction, in document order.
+    """
+    return _iter_rows(ReactionHTMLParser(), file)
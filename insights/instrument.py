@@ -0,0 +1,283 @@
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+_recorder = None
+# (process id, cProfile.Profile) shared by all tasks a worker process runs.
+_worker_profiler = None
+
+
+class Recorder(object):
+    """
+    Collects the stages run while it is active.
+
+    Every stage is stored as a Chrome trace "complete" event with its wall
+    time, the number of rows it processed and the peak RSS the process reached
+    so far when it finished, which is not specific to the stage. If profile is
+    the name of a stage, every call of that stage runs under one cProfile
+    profiler per process whose combined stats are dumped to profile_path after
+    each call.
+    """
+
+    def __init__(self, profile=None, profile_path=None, worker=False):
+        self.events = []
+        self.profile = profile
+        self.profile_path = profile_path
+        self.worker = worker
+        self._profiler = None
+        self._profiling = False
+        self._stack = []
+
+    def settings(self):
+        return self.profile, self.profile_path
+
+
+class _Stage(object):
+    __slots__ = ("name", "args", "rows", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.rows = None
+        self.start = None
+
+
+class stage(object):
+    """
+    Context manager that records a stage in the active trace.
+
+    Does nothing when no trace is active. The number of rows the stage
+    processed can be set with `add_rows` from inside the stage.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage, e.g. "parser.messages".
+    **args
+        Extra values stored with the event, e.g. the conversation.
+    """
+
+    def __init__(self, name, **args):
+        self._stage = _Stage(name, args)
+        self._profiling = False
+
+    def __enter__(self):
+        recorder = _recorder
+        if recorder is None:
+            return self
+        recorder._stack.append(self._stage)
+        if recorder.profile == self._stage.name and not recorder._profiling:
+            if recorder._profiler is None:
+                recorder._profiler = cProfile.Profile()
+            recorder._profiling = self._profiling = True
+            recorder._profiler.enable()
+        self._stage.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        recorder = _recorder
+        if recorder is None or self._stage.start is None:
+            return False
+        end = time.time()
+        if self._profiling:
+            recorder._profiler.disable()
+            recorder._profiling = False
+            recorder._profiler.dump_stats(_profile_file(recorder))
+        recorder._stack.remove(self._stage)
+        args = dict((key, str(value)) for key, value in self._stage.args.items())
+        if self._stage.rows is not None:
+            args["rows"] = self._stage.rows
+        args["process_peak_rss_mb"] = round(peak_rss() / 2 ** 20, 1)
+        if exc_type is not None:
+            args["error"] = exc_type.__name__
+        recorder.events.append({"name": self._stage.name, "ph": "X", "ts": int(self._stage.start * 1e6),
+                                "dur": int((end - self._stage.start) * 1e6), "pid": os.getpid(),
+                                "tid": threading.get_ident() % 2 ** 31, "args": args})
+        return False
+
+
+def add_rows(rows):
+    """
+    Add rows to the number of rows processed by the innermost running stage.
+    """
+    if _recorder is not None and _recorder._stack:
+        current = _recorder._stack[-1]
+        current.rows = (current.rows or 0) + rows
+
+
+def record(name, seconds, rows=None, **args):
+    """
+    Add a stage of the given duration, ending now, to the active trace.
+
+    For time that is measured in many small pieces, e.g. the I/O wait of a
+    prefetch queue, which would flood the trace as separate stages.
+    """
+    if _recorder is None:
+        return
+    end = time.time()
+    args = dict((key, str(value)) for key, value in args.items())
+    if rows is not None:
+        args["rows"] = rows
+    args["process_peak_rss_mb"] = round(peak_rss() / 2 ** 20, 1)
+    _recorder.events.append({"name": name, "ph": "X", "ts": int((end - seconds) * 1e6),
+                             "dur": int(seconds * 1e6), "pid": os.getpid(),
+                             "tid": threading.get_ident() % 2 ** 31, "args": args})
+
+
+def instrumented(name):
+    """
+    Decorator that records every call of the function as a stage called name.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return function(*args, **kwargs)
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def active():
+    return _recorder is not None
+
+
+class trace(object):
+    """
+    Record the stages run inside the with block.
+
+    Parameters
+    ----------
+    path : str or None, optional
+        Write the stages to this file in the Chrome trace event format, which
+        can be opened in chrome://tracing or https://ui.perfetto.dev.
+    profile : str or None, optional
+        Name of a single stage to run under cProfile, e.g. "plot_messages".
+    profile_path : str or None, optional
+        File the cProfile stats are dumped to, "<profile>.prof" if None. Stats
+        of worker processes go to files suffixed with their process id.
+    summary : bool, default True
+        Print the time spent per stage when the block ends.
+    """
+
+    def __init__(self, path=None, profile=None, profile_path=None, summary=True):
+        self.path = path
+        self.summary = summary
+        self.recorder = Recorder(profile, profile_path or (profile + ".prof" if profile else None))
+        self._previous = None
+
+    def __enter__(self):
+        global _recorder
+        self._previous = _recorder
+        _recorder = self.recorder
+        return self.recorder
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _recorder
+        _recorder = self._previous
+        if self.path is not None:
+            write_trace(self.path, self.recorder.events)
+        if self.summary:
+            print_summary(self.recorder.events)
+        return False
+
+
+def write_trace(path, events):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as trace_file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+    os.replace(tmp_path, path)
+
+
+def summarize(events):
+    """
+    Total wall time, number of calls, rows and highest process peak RSS per stage name.
+
+    Returns
+    -------
+    OrderedDict
+        Stage name to a dict with calls, seconds, rows and process_peak_rss_mb,
+        slowest stage first.
+    """
+    totals = {}
+    for event in events:
+        total = totals.setdefault(event["name"], {"calls": 0, "seconds": 0.0, "rows": 0,
+                                                  "process_peak_rss_mb": 0.0})
+        total["calls"] += 1
+        total["seconds"] += event["dur"] / 1e6
+        total["rows"] += event["args"].get("rows", 0)
+        total["process_peak_rss_mb"] = max(total["process_peak_rss_mb"], event["args"]["process_peak_rss_mb"])
+    return OrderedDict(sorted(totals.items(), key=lambda item: -item[1]["seconds"]))
+
+
+def print_summary(events):
+    print("{:<36} {:>6} {:>10} {:>10} {:>17}".format("stage", "calls", "seconds", "rows", "process peak rss"))
+    for name, total in summarize(events).items():
+        print("{:<36} {:>6} {:>10.3f} {:>10} {:>14.1f} MB".format(name, total["calls"], total["seconds"],
+                                                                  total["rows"], total["process_peak_rss_mb"]))
+
+
+def peak_rss():
+    """
+    Peak resident set size of the current process in bytes, 0 if unknown.
+    """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def submit(executor, function, *args, **kwargs):
+    """
+    executor.submit that records the stages run in the worker process when a
+    trace is active. Collect the result with `result`.
+    """
+    settings = _recorder.settings() if _recorder is not None else None
+    return executor.submit(_call, settings, function, args, kwargs)
+
+
+def result(future):
+    """
+    Result of a future created by `submit`, adding the worker's stages to the active trace.
+    """
+    value, events = future.result()
+    if events and _recorder is not None:
+        _recorder.events.extend(events)
+    return value
+
+
+def _call(settings, function, args, kwargs):
+    if settings is None:
+        return function(*args, **kwargs), None
+    global _recorder, _worker_profiler
+    previous = _recorder
+    _recorder = Recorder(*settings, worker=True)
+    if _recorder.profile is not None:
+        # Accumulate every task of this worker in one profiler, so each dump holds the combined stats.
+        if _worker_profiler is None or _worker_profiler[0] != os.getpid():
+            _worker_profiler = (os.getpid(), cProfile.Profile())
+        _recorder._profiler = _worker_profiler[1]
+    try:
+        return function(*args, **kwargs), _recorder.events
+    finally:
+        _recorder = previous
+
+
+def _profile_file(recorder):
+    if recorder.worker:
+        root, extension = os.path.splitext(recorder.profile_path)
+        return "{}.{}{}".format(root, os.getpid(), extension)
+    return recorder.profile_path
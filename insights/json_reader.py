@@ -0,0 +1,105 @@
+import datetime
+import json
+import os
+import re
+
+from insights.html_reader import REACTION_PATTERN
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October',
+               'November', 'December']
+MESSAGE_FILE_PATTERN = re.compile(r"^message(?:_(\d+))?\.json$")
+
+
+def message_files(conversation_path, names=None):
+    """
+    The message.json or message_1.json, message_2.json, ... parts of a conversation
+    in export order, newest messages first.
+
+    names are the files in conversation_path if they were already listed.
+    """
+    parts = []
+    for name in (os.listdir(conversation_path) if names is None else names):
+        match = MESSAGE_FILE_PATTERN.match(name)
+        if match:
+            parts.append((int(match.group(1) or 0), os.path.join(conversation_path, name)))
+    return [path for _, path in sorted(parts)]
+
+
+def format_time(timestamp):
+    """
+    Format a unix timestamp like the timestamps in the html export, in local time.
+    """
+    time = datetime.datetime.fromtimestamp(timestamp)
+    return "{:02d} {} {} {:02d}:{:02d}".format(time.day, MONTH_NAMES[time.month - 1], time.year,
+                                              time.hour, time.minute)
+
+
+def fix_text(text):
+    """
+    Undo the latin-1 mojibake of the json export, which writes utf-8 bytes as
+    separate \\u00xx escapes.
+    """
+    try:
+        return text.encode('latin-1').decode('utf-8')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return text
+
+
+def _iter_items(json_file, prefix):
+    """
+    Yield the items of the array at prefix of a file opened in binary mode,
+    streamed with ijson when available.
+    """
+    if ijson is not None:
+        for item in ijson.items(json_file, prefix + ".item"):
+            yield item
+    else:
+        for item in json.load(json_file).get(prefix, []):
+            yield item
+
+
+def read_messages(json_file):
+    """
+    Stream the messages of a single message*.json part opened in binary mode,
+    e.g. a member of an export zip file.
+
+    Yields
+    ------
+    list
+        [time, sender, text] for every message, formatted like the html parser output.
+    """
+    for message in _iter_items(json_file, "messages"):
+        sender = message.get("sender_name")
+        sender = fix_text(sender) if sender is not None else "unknown"
+        content = message.get("content")
+        text = fix_text(content) if content is not None else "unknown"
+        yield [format_time(float(message["timestamp_ms"]) / 1000), sender, text]
+
+
+def read_reactions(json_file):
+    """
+    Stream the reactions of likes_and_reactions/posts_and_comments.json opened in binary mode.
+
+    Yields
+    ------
+    list
+        [time, reaction, liker, poster] for every reaction, formatted like the html parser output.
+    """
+    for reaction in _iter_items(json_file, "reactions"):
+        title = fix_text(reaction.get("title", ""))
+        match = REACTION_PATTERN.match(title)
+        if match is None:
+            raise ValueError("Unrecognised reaction: {}".format(title))
+        liker, poster = match.group(1, 2)
+        name = "like"
+        for data in reaction.get("data", []):
+            if "reaction" in data:
+                name = data["reaction"].get("reaction", name).lower()
+                break
+        yield [format_time(float(reaction["timestamp"])), name, liker, poster]
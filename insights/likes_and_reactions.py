@@ -1,11 +1,56 @@
 import datetime
 import os
 
-import matplotlib.pyplot as plt
+from insights import instrument
+from insights.utils import compact_frame, format_bytes, new_figure, parse_time, save_figure
+import numpy as np
 import pandas as pd
 
 
-def like_statistics(data_path, top=20, yearly=False, fixed_top=False, show=False):
+GRID_COLUMNS = 4
+MAX_HEATMAP_LABELS = 1000
+
+
+@instrument.instrumented("load_likes")
+def load_likes(data_path, lean=False):
+    """
+    Load likes_and_reactions/posts_and_comments.csv sorted by time.
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the root directory of your personal facebook data.
+    lean : bool, default False
+        Only read the time and poster columns, with poster as categorical and an
+        added int16 year column, and print the memory use before and after.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns time (datetime64), reaction, liker and poster, or time, poster and
+        year when lean.
+    """
+    csv_path = os.path.join(data_path, "likes_and_reactions", "posts_and_comments.csv")
+    if not lean:
+        df = pd.read_csv(csv_path)
+        instrument.add_rows(len(df))
+        df['time'] = parse_time(df['time'])
+        return df.sort_values('time')
+
+    df = pd.read_csv(csv_path, usecols=['time', 'poster'])
+    instrument.add_rows(len(df))
+    before = df.memory_usage(deep=True).sum()
+    df['time'] = parse_time(df['time'])
+    df['year'] = df['time'].dt.year
+    df = compact_frame(df, categories=['poster']).sort_values('time')
+    print("Loaded {} likes in {} ({} before compaction).".format(
+        len(df), format_bytes(df.memory_usage(deep=True).sum()), format_bytes(before)))
+    return df
+
+
+@instrument.instrumented("like_statistics")
+def like_statistics(data_path, top=20, yearly=False, fixed_top=False, show=False, lean=False, layout="rows",
+                    messages=False):
     """
 
     Parameters
@@ -24,6 +69,18 @@ def like_statistics(data_path, top=20, yearly=False, fixed_top=False, show=False
         only be calculated for each year individually.
     show : bool, default to False
         Show the generated plot.
+    lean : bool, default False
+        Load the likes with `load_likes(data_path, lean=True)`.
+    layout : {"rows", "grid", "heatmap"}, default "rows"
+        Used when yearly is not False.
+        "rows" draws one bar chart per year below each other, "grid" arranges
+        them in GRID_COLUMNS columns and "heatmap" draws a single poster by year
+        heatmap of the overall top friends/pages, which stays small for long
+        histories.
+    messages : bool, default False
+        Used when yearly is False.
+        Draw the number of messages every friend sent next to their likes,
+        joined from the person index, see `insights.people.join_likes`.
 
 
     Notes
@@ -31,50 +88,62 @@ def like_statistics(data_path, top=20, yearly=False, fixed_top=False, show=False
     When plotting yearly data, top cannot be False.
 
     """
+    if layout not in ["rows", "grid", "heatmap"]:
+        raise ValueError("layout should be 'rows', 'grid' or 'heatmap'.")
     likes_path = os.path.join(data_path, "likes_and_reactions")
-    csv_path = os.path.join(likes_path, "posts_and_comments.csv")
-    df = pd.read_csv(csv_path)
-    df['time'] = pd.to_datetime(df['time'], format="%d %B %Y %H:%M")
-    df = df.sort_values('time')
-    df['date'] = df['time'].dt.date
-    end_year = df['date'].max().year
-    start_year = df['date'].min().year
+    df = load_likes(data_path, lean=lean)
+    instrument.add_rows(len(df))
+    end_year = df['time'].max().year
+    start_year = df['time'].min().year
     if isinstance(yearly, tuple):
         start_year = yearly[0]
         end_year = yearly[1]
     rows = end_year - start_year + 1
     start_date = datetime.date(start_year,1,1)
     end_date = datetime.date(end_year,12, 31)
-    df = df[(df['date'] > start_date) & (df['date'] < end_date)]
-    index = df.poster.value_counts().head(top).index
+    dates = df['time'].dt.normalize()
+    df = df[(dates > pd.Timestamp(start_date)) & (dates < pd.Timestamp(end_date))]
 
     if yearly:
-        if top is not None:
-            x_length = top * 1
-            fig, axes = plt.subplots(rows, 1, figsize=(x_length, 6 * rows))
+        if top is None:
+            raise ValueError("Yearly=true and top=None cannot be combined.")
+        per_year = _likes_per_year(df, start_year, end_year)
+        index = _top_posters(per_year.sum(), top).index
+        if layout == "heatmap":
+            fig = _plot_yearly_heatmap(per_year[index], show)
+        else:
+            if layout == "grid":
+                columns = min(GRID_COLUMNS, rows)
+                grid_rows = -(-rows // columns)
+                fig = new_figure(show, figsize=(max(top * 0.5, 4) * columns, 6 * grid_rows))
+                axes = fig.subplots(grid_rows, columns, squeeze=False).ravel()
+                for ax in axes[rows:]:
+                    ax.set_visible(False)
+            else:
+                fig = new_figure(show, figsize=(top * 1, 6 * rows))
+                axes = fig.subplots(rows, 1, squeeze=False)[:, 0]
             fig.subplots_adjust(hspace=1)
             for r in range(rows):
                 ax = axes[r]
-                df_year = df[df['time'].dt.year == start_year + r]
+                counts = _top_posters(per_year.iloc[r], top)
                 if fixed_top:
-                    df_year.poster.value_counts().head(top).reindex(index, fill_value=0).plot(kind='bar', ax=ax,
-                                                            alpha=0.7)
-                else:
-                    df_year.poster.value_counts().head(top).plot(kind='bar', ax=ax,
-                                                            alpha=0.7)
+                    counts = counts.reindex(index, fill_value=0)
+                counts.plot(kind='bar', ax=ax, alpha=0.7)
                 ax.yaxis.grid(linestyle=':', alpha=0.6)
                 ax.set_title(start_year + r)
-        else:
-            raise ValueError("Yearly=true and top=None cannot be combined.")
     else:
+        counts = _poster_counts(df)
         if top is not None:
+            counts = counts.head(top)
             x_length = top * 1
-            fig, ax = plt.subplots(1,1, figsize=(x_length ,5))
-            df.poster.value_counts().head(top).plot(kind='bar', alpha=0.7)
         else:
-            x_length = len(df.poster.value_counts()) * 0.3
-            fig, ax = plt.subplots(1,1, figsize=(x_length ,5))
-            df.poster.value_counts().plot(kind='bar', alpha=0.7)
+            x_length = len(counts) * 0.3
+        fig = new_figure(show, figsize=(x_length ,5))
+        ax = fig.add_subplot(111)
+        if messages:
+            _plot_likes_and_messages(data_path, counts, ax)
+        else:
+            counts.plot(kind='bar', ax=ax, alpha=0.7)
         ax.yaxis.grid(linestyle=':', alpha=0.6)
 
 
@@ -84,8 +153,75 @@ def like_statistics(data_path, top=20, yearly=False, fixed_top=False, show=False
 
     file_name =  "likes_statistics.png"
     file_name = os.path.join(output_path, file_name)
-    plt.savefig(file_name, bbox_inches='tight')
+    save_figure(fig, file_name, show)
+
+
+def _likes_per_year(df, start_year, end_year):
+    """
+    Number of likes per year and poster from a single groupby.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row for every year from start_year to end_year and one column per poster.
+    """
+    years = df['year'] if 'year' in df.columns else df['time'].dt.year.rename('year')
+    per_year = df.groupby([years, df['poster']], observed=True, sort=False).size().unstack(fill_value=0)
+    return per_year.reindex(range(start_year, end_year + 1), fill_value=0)
+
+
+def _top_posters(counts, top):
+    """
+    The top posters with at least one like, most liked first.
+    """
+    counts = counts[counts > 0].sort_values(ascending=False, kind='mergesort')
+    return counts.head(top)
 
-    if show:
-        plt.show()
-    plt.close()
\ No newline at end of file
+
+def _plot_yearly_heatmap(per_year, show):
+    from matplotlib.ticker import FixedLocator
+
+    counts = per_year.T
+    fig = new_figure(show, figsize=(max(6, 0.6 * counts.shape[1] + 4), max(4, 0.35 * counts.shape[0] + 2)))
+    ax = fig.add_subplot(111)
+    image = ax.imshow(counts.values, aspect='auto', cmap='Blues', interpolation='nearest')
+    ax.xaxis.set_major_locator(FixedLocator(range(counts.shape[1])))
+    ax.set_xticklabels(counts.columns, rotation=90)
+    ax.yaxis.set_major_locator(FixedLocator(range(counts.shape[0])))
+    ax.set_yticklabels(counts.index)
+    if counts.size <= MAX_HEATMAP_LABELS:
+        threshold = counts.values.max() / 2.0
+        for (y, x), value in np.ndenumerate(counts.values):
+            ax.text(x, y, value, ha='center', va='center', size=8,
+                    color='white' if value > threshold else 'black')
+    fig.colorbar(image, ax=ax, label='Likes')
+    ax.set_title("Likes per year")
+    return fig
+
+
+def _plot_likes_and_messages(data_path, counts, ax):
+    from insights import people
+
+    joined = people.join_likes(data_path, people.people(data_path)[['messages']], counts=counts)
+    joined = joined.reindex(counts.index.astype(str))
+    positions = np.arange(len(joined))
+    ax.bar(positions - 0.2, joined['likes'].values, width=0.4, color="#4286f4", alpha=0.7, label="likes")
+    ax.set_ylabel("Likes")
+    ax_messages = ax.twinx()
+    ax_messages.bar(positions + 0.2, joined['messages'].values, width=0.4, color="#f4a142", alpha=0.7,
+                    label="messages")
+    ax_messages.set_ylabel("Messages")
+    ax_messages.set_ylim(bottom=0)
+    ax.set_xticks(positions)
+    ax.set_xticklabels(joined.index, rotation=90)
+    ax.set_xlim(-0.5, len(joined) - 0.5)
+    handles = ax.get_legend_handles_labels()[0] + ax_messages.get_legend_handles_labels()[0]
+    ax.legend(handles, ["likes", "messages"], loc='upper right')
+
+
+def _poster_counts(df):
+    """
+    Number of likes per poster, most liked first, without the unused categories of a lean frame.
+    """
+    counts = df['poster'].value_counts()
+    return counts[counts > 0]
@@ -1,18 +1,312 @@
 import datetime
+import io
 import os
+import pickle
 
-from insights.utils import m2hm, get_colors
-from matplotlib.dates import DayLocator, DateFormatter
-from matplotlib.ticker import FuncFormatter, MultipleLocator
-import matplotlib.pyplot as plt
-import numpy as np
-import pandas as pd
+from insights import aggregates, files, instrument, store
+from insights.utils import m2hm, compact_frame, format_bytes, get_colors, new_figure, parse_time, save_figure
 
 
 COLORS = ['#5DADE2', '#EB984E', '#48C9B0', '#F4D03F', '#AF7AC5', '#EC7063', '#45B39D', '#CACFD2']
 EDGE_COLORS = ['#2874A6', '#AF601A', '#148F77', '#B7950B', '#76448A', '#B03A2E', '#117A65', '#839192']
+# plot_messages switches to a heatmap above this number of messages or when the
+# scatter plot would have more pixels than MAX_FIGURE_PIXELS (about 400 MB of RGBA).
+HEATMAP_THRESHOLD = 20000
+MAX_FIGURE_PIXELS = 10 ** 8
+HEATMAP_MINUTES = 15
+MAX_HEATMAP_DAYS = 1000
+MAX_HEATMAP_SENDERS = 8
+# Heatmap sizes in inches.
+MAX_HEATMAP_WIDTH = 30
+HEATMAP_HEIGHT = 4
+# Bar labels in plot_amount_messages are only drawn when readable, sizes in inches.
+MIN_LABEL_HEIGHT = 0.15
+MIN_LABEL_WIDTH = 0.25
+MAX_BAR_LABELS = 5000
+# plot_amount_messages groups days in weeks or months to stay within this width, sizes in inches.
+MAX_PLOT_WIDTH = 120
+MAX_PLOT_HEIGHT = 60
+
+
+CACHE_NAME = "messages/messages_cache.pkl"
+
+_memory_cache = {}
+
+
+@instrument.instrumented("load_messages")
+def load_messages(data_path, chats=None, columns=None, cache=True, lean=False):
+    """
+    Load the messages of all conversations in a single frame sorted by time.
+
+    Reads the consolidated store written by `parser.py --output store` when it
+    exists and falls back to the per-conversation message.csv files otherwise.
+    The combined frame is memoized in process and persisted to
+    messages/messages_cache.pkl, keyed on the size and mtime of every source
+    file, so a batch of analyses only pays the read and parse cost once.
+    When chats are given and all conversations are not memoized yet, only those
+    chats are read and nothing is cached.
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the root directory of your personal facebook data.
+    chats : list of str or None, optional
+        Names of the conversation directories to return, all if None.
+    columns : list of str or None, optional
+        Columns to return, all if None.
+    cache : bool, default True
+        Use and update the in-process and on-disk cache.
+    lean : bool, default False
+        Return a compact frame without text: sender and chat are categorical and
+        the integer row column holds the position of every message in its
+        conversation, so its text can be fetched later with `load_text`. The
+        memory use before and after compaction is printed. Lean frames are only
+        memoized in process.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns time (datetime64), sender, text and chat, the name of the
+        conversation directory.
+    """
+    if lean:
+        return _load_lean_messages(data_path, chats=chats, columns=columns, cache=cache)
+    if not cache:
+        df = _read_messages(data_path, chats=chats, columns=columns)
+        return df.sort_values('time', kind='mergesort', ignore_index=True)
+
+    key = os.path.abspath(data_path)
+    signature = _source_signature(data_path)
+    cached = _memory_cache.get(key)
+    if chats is not None and (cached is None or cached[0] != signature):
+        return load_messages(data_path, chats=chats, columns=columns, cache=False)
+    if cached is None or cached[0] != signature:
+        cached = _load_disk_cache(data_path, signature)
+        if cached is None:
+            df = _read_messages(data_path)
+            df = df.sort_values('time', kind='mergesort', ignore_index=True)
+            cached = (signature, df)
+            _save_disk_cache(data_path, cached)
+        _memory_cache[key] = cached
+
+    return _select(cached[1], chats, columns)
+
+
+@instrument.instrumented("load_text")
+def load_text(data_path, df):
+    """
+    Text of the messages of a frame returned by `load_messages(..., lean=True)`.
+
+    Only the text column of the conversations that occur in df is read.
+
+    Returns
+    -------
+    pandas.Series
+        Text of every message, aligned with df.
+    """
+    import pandas as pd
+
+    text = pd.Series(index=df.index, dtype=object, name='text')
+    for chat, rows in df.groupby('chat', observed=True, sort=False)['row']:
+        chat_text = _read_messages(data_path, chats=[chat], columns=['text'])['text'].values
+        text[rows.index] = chat_text[rows.values]
+    return text
+
+
+def _select(df, chats, columns):
+    import pandas as pd
+
+    if chats is not None:
+        df = df[df['chat'].isin(chats)]
+    if columns is not None:
+        df = df[columns]
+    df = df.copy()
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].cat.remove_unused_categories()
+    return df
+
+
+def _load_lean_messages(data_path, chats=None, columns=None, cache=True):
+    if columns is not None and 'text' in columns:
+        raise ValueError("Lean frames do not hold text, use load_text.")
+    if not cache:
+        return _select(_read_lean_messages(data_path, chats=chats), None, columns)
+
+    key = (os.path.abspath(data_path), "lean")
+    signature = _source_signature(data_path)
+    cached = _memory_cache.get(key)
+    if chats is not None and (cached is None or cached[0] != signature):
+        return _select(_read_lean_messages(data_path, chats=chats), None, columns)
+    if cached is None or cached[0] != signature:
+        cached = (signature, _read_lean_messages(data_path))
+        _memory_cache[key] = cached
+    return _select(cached[1], chats, columns)
+
+
+def _read_lean_messages(data_path, chats=None):
+    df = _read_messages(data_path, chats=chats, columns=['time', 'sender', 'chat'])
+    before = df.memory_usage(deep=True).sum()
+    # Position in the conversation's own read order, which load_text reproduces.
+    df['row'] = df.groupby('chat', observed=True, sort=False).cumcount()
+    df = compact_frame(df, categories=['sender', 'chat'])
+    df = df.sort_values('time', kind='mergesort', ignore_index=True)
+    print("Loaded {} messages in {} ({} before compaction).".format(
+        len(df), format_bytes(df.memory_usage(deep=True).sum()), format_bytes(before)))
+    return df
+
+
+def clear_cache(data_path=None):
+    """
+    Drop the in-process cache and the on-disk cache of data_path.
+    """
+    _memory_cache.clear()
+    if data_path is not None:
+        cache_path = os.path.join(data_path, CACHE_NAME)
+        if os.path.isfile(cache_path):
+            os.remove(cache_path)
+
+
+def source_files(data_path):
+    """
+    Paths of the csv or store files that hold the messages of every chat, from a
+    single listing of the inbox or store.
 
-def plot_messages(data_path, conversation, end_date=None, start_date=30, tick_width=1, show=False):
+    Returns
+    -------
+    dict
+        Name of every conversation directory to a list of paths.
+    """
+    in_store = store.exists(data_path)
+    sources = {}
+    for source_path, _ in _source_stats(data_path):
+        if in_store:
+            chat = store.partition_chat(data_path, source_path)
+        else:
+            chat = os.path.basename(os.path.dirname(source_path))
+        sources.setdefault(chat, []).append(source_path)
+    return sources
+
+
+def _source_stats(data_path, chats=None):
+    """
+    (path, os.stat_result) of the csv or store files that hold the messages of the given chats.
+    """
+    if store.exists(data_path):
+        if chats is None:
+            roots = [store.store_path(data_path)]
+        else:
+            roots = [store.chat_path(data_path, chat) for chat in chats]
+        stats = []
+        for root_path in roots:
+            if os.path.isdir(root_path):
+                stats.extend(files.walk(root_path, skip_prefix="_"))
+        return stats
+    path = os.path.join(data_path, "messages/inbox")
+    if chats is None:
+        listing = files.scan(path)
+    else:
+        listing = dict((chat, files.list_files(os.path.join(path, chat))) for chat in chats)
+    return [(os.path.join(path, directory, "message.csv"), names["message.csv"])
+            for directory, names in listing.items() if "message.csv" in names]
+
+
+def _source_signature(data_path):
+    signature = []
+    for source_path, stat in sorted(_source_stats(data_path)):
+        signature.append((os.path.relpath(source_path, data_path), stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+
+def _load_disk_cache(data_path, signature):
+    cache_path = os.path.join(data_path, CACHE_NAME)
+    if not os.path.isfile(cache_path):
+        return None
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            cached = pickle.load(cache_file)
+    except Exception:
+        return None
+    if cached[0] != signature:
+        return None
+    return cached
+
+
+def _save_disk_cache(data_path, cached):
+    cache_path = os.path.join(data_path, CACHE_NAME)
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, 'wb') as cache_file:
+        pickle.dump(cached, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+
+
+def _message_counts(data_path, df=None, chats=None, chunksize=None, senders=None):
+    """
+    Number of messages per date, chat, sender and hour.
+
+    Aggregates df when given. Otherwise the aggregate cube written by the parser
+    is used when present so the raw messages are not loaded at all. Without the
+    cube the messages are loaded, or streamed in chunks of chunksize messages
+    (only counting those of senders) if chunksize is given.
+    """
+    if df is None:
+        counts = aggregates.load_counts(data_path, chats=chats)
+        if counts is not None:
+            return counts
+        if chunksize is not None:
+            return aggregates.stream_counts(data_path, chats=chats, senders=senders, chunksize=chunksize)
+        df = load_messages(data_path, chats=chats, columns=['time', 'sender', 'chat'])
+    return aggregates.count_messages(df)
+
+
+@instrument.instrumented("read_messages")
+def _read_messages(data_path, chats=None, columns=None):
+    """
+    Read the messages of all (or the given) conversations without caching.
+    """
+    import pandas as pd
+
+    if store.exists(data_path):
+        df = store.read_messages(data_path, chats=chats, columns=columns)
+        instrument.add_rows(len(df))
+        return df
+
+    csv_stats = [(csv_path, stat) for csv_path, stat in _source_stats(data_path, chats=chats)
+                 if os.path.basename(os.path.dirname(csv_path)) not in ["insights", "stickers_used"]]
+    frames = []
+    # Parse every csv while the next ones are read in the background.
+    loaded = files.Prefetcher(csv_stats, _read_csv_source, name="read_messages.io")
+    for (csv_path, _), data in zip(csv_stats, loaded):
+        if data is None:
+            continue
+        source = io.BytesIO(data) if isinstance(data, bytes) else data
+        new_df = pd.read_csv(source, usecols=[c for c in columns if c != 'chat'] if columns else None)
+        new_df['chat'] = os.path.basename(os.path.dirname(csv_path))
+        frames.append(new_df)
+    df = pd.concat(frames, ignore_index=True)
+    instrument.add_rows(len(df))
+    if 'time' in df.columns:
+        df['time'] = parse_time(df['time'])
+    if columns is not None:
+        df = df[columns]
+    return df
+
+
+def _read_csv_source(source):
+    """
+    Content of a (path, os.stat_result) csv file for the prefetch queue, files
+    larger than files.PREFETCH_MAX_BYTES are returned as their path and only
+    read when they are parsed.
+    """
+    csv_path, stat = source
+    if stat.st_size > files.PREFETCH_MAX_BYTES:
+        return csv_path
+    return files.read_bytes(csv_path)
+
+
+@instrument.instrumented("plot_messages")
+def plot_messages(data_path, conversation, end_date=None, start_date=30, tick_width=1, show=False, df=None,
+                  mode="auto"):
     """
     Plot the messages for the conversation over the specified time period.
 
@@ -31,13 +325,22 @@ def plot_messages(data_path, conversation, end_date=None, start_date=30, tick_wi
         width in inches between consecutive ticks on both axis.
     show : bool, default to False
         Show the generated plot.
+    df : pandas.DataFrame or None, optional
+        Messages of the conversation as returned by `load_messages`.
+        Loaded from data_path if None.
+    mode : {"auto", "scatter", "heatmap"}, default "auto"
+        "scatter" draws every message as a marker. "heatmap" draws a day by
+        time of day histogram per sender whose render time and figure size do
+        not depend on the number of messages. "auto" switches to the heatmap
+        when the period contains more than HEATMAP_THRESHOLD messages or when
+        the scatter plot would be larger than MAX_FIGURE_PIXELS pixels.
     """
-    messages_path = os.path.join(data_path, "messages/inbox")
-    path = os.path.join(messages_path, conversation)
-    csv_path = os.path.join(path, "message.csv")
+    from matplotlib.dates import DayLocator, DateFormatter
+    from matplotlib.ticker import FuncFormatter, MultipleLocator
+    import pandas as pd
 
-    df = pd.read_csv(csv_path)
-    df['time'] = pd.to_datetime(df['time'], format="%d %B %Y %H:%M")
+    if df is None:
+        df = load_messages(data_path, chats=[conversation], columns=['time', 'sender'])
     df = df.sort_values('time')
     df['date'] = df['time'].dt.date
     df['minutes'] = df['time'].dt.hour * 60 + df['time'].dt.minute
@@ -64,40 +367,43 @@ def plot_messages(data_path, conversation, end_date=None, start_date=30, tick_wi
     if df.shape[0] <= 1 or start_date == end_date:
         return
 
-    fig = plt.figure()
-    ax = fig.add_subplot(111)
-    for i, sender in enumerate(senders):
-        i = i % len(COLORS)
-        df_sender = df[df['sender'] == sender]
-        ax.plot_date(df_sender['date'], df_sender['minutes'], color=COLORS[i], markeredgecolor=EDGE_COLORS[i],
-                     alpha=0.5, label=sender)
-
-    major_locator = MultipleLocator(60)
-    minor_locator = MultipleLocator(10)
-    ax.set_ylim(0, 1440)
-    ax.yaxis.set_major_locator(major_locator)
-    ax.yaxis.set_minor_locator(minor_locator)
-    ax.yaxis.set_major_formatter(FuncFormatter(m2hm))
-    y_length = tick_width * 24 * 6
-    y_length = max(y_length, 10)
-    ax.yaxis.grid(linestyle=':', linewidth=0.5)
-
     period = (end_date - start_date).days
-    if period > 366:
-        interval = 7
+    if mode == "auto":
+        x_length, y_length = _scatter_size(period, tick_width)
+        too_large = _figure_pixels(x_length, y_length) > MAX_FIGURE_PIXELS
+        mode = "heatmap" if df.shape[0] > HEATMAP_THRESHOLD or too_large else "scatter"
+    if mode == "heatmap":
+        fig = _plot_messages_heatmap(df, senders, start_date, end_date, tick_width, show)
     else:
-        interval = 1
-    ax.xaxis.set_major_locator(DayLocator(interval=interval))
-    ax.xaxis.set_major_formatter(DateFormatter('%d/%m/%Y'))
-    ax.xaxis.grid(linestyle=':', linewidth=0.5)
-    x_length = period * tick_width
-    x_length = max(x_length, 5)
-    fig.set_size_inches(x_length, y_length)
-    fig.autofmt_xdate(rotation=90)
-    ax.legend()
-    ax.set_title("Messages activity.")
-    ax.set_xlabel("Date")
-    ax.set_ylabel("Time")
+        fig = new_figure(show)
+        ax = fig.add_subplot(111)
+        for i, sender in enumerate(senders):
+            i = i % len(COLORS)
+            df_sender = df[df['sender'] == sender]
+            ax.plot_date(df_sender['date'], df_sender['minutes'], color=COLORS[i], markeredgecolor=EDGE_COLORS[i],
+                         alpha=0.5, label=sender)
+
+        major_locator = MultipleLocator(60)
+        minor_locator = MultipleLocator(10)
+        ax.set_ylim(0, 1440)
+        ax.yaxis.set_major_locator(major_locator)
+        ax.yaxis.set_minor_locator(minor_locator)
+        ax.yaxis.set_major_formatter(FuncFormatter(m2hm))
+        ax.yaxis.grid(linestyle=':', linewidth=0.5)
+
+        if period > 366:
+            interval = 7
+        else:
+            interval = 1
+        ax.xaxis.set_major_locator(DayLocator(interval=interval))
+        ax.xaxis.set_major_formatter(DateFormatter('%d/%m/%Y'))
+        ax.xaxis.grid(linestyle=':', linewidth=0.5)
+        fig.set_size_inches(*_scatter_size(period, tick_width))
+        fig.autofmt_xdate(rotation=90)
+        ax.legend()
+        ax.set_title("Messages activity.")
+        ax.set_xlabel("Date")
+        ax.set_ylabel("Time")
 
     output_path = os.path.join(data_path, "output")
     if not os.path.exists(output_path):
@@ -105,17 +411,91 @@ def plot_messages(data_path, conversation, end_date=None, start_date=30, tick_wi
 
     file_name = conversation + "_messages.png"
     file_name = os.path.join(output_path, file_name)
-    plt.savefig(file_name, bbox_inches='tight')
-    if show:
-        plt.show()
-    plt.close()
+    save_figure(fig, file_name, show)
     return
 
 
-def plot_amount_messages(data_path, conversation, end_date=None, start_date=30, tick_width=1, show=False):
+def _scatter_size(period, tick_width):
+    """
+    Width and height in inches of the scatter plot of plot_messages.
+    """
+    return max(period * tick_width, 5), max(tick_width * 24 * 6, 10)
+
+
+def _figure_pixels(width, height):
+    """
+    Number of pixels of a width by height inch figure saved at the configured dpi.
+    """
+    from matplotlib import rcParams
+
+    dpi = rcParams['savefig.dpi']
+    if dpi == 'figure':
+        dpi = rcParams['figure.dpi']
+    return width * height * dpi ** 2
+
+
+def _plot_messages_heatmap(df, senders, start_date, end_date, tick_width, show):
+    """
+    Day by time of day histogram of the messages of every sender.
+
+    Senders beyond the most active MAX_HEATMAP_SENDERS are combined in one panel.
+    """
+    from matplotlib.colors import LinearSegmentedColormap
+    from matplotlib.dates import AutoDateLocator, DateFormatter, date2num
+    from matplotlib.ticker import FuncFormatter, MultipleLocator
+    import numpy as np
+    import pandas as pd
+
+    period = (end_date - start_date).days + 1
+    day_bins = min(period, MAX_HEATMAP_DAYS)
+    minute_bins = 1440 // HEATMAP_MINUTES
+
+    sender_counts = df['sender'].value_counts()
+    top_senders = [sender for sender in senders if sender in set(sender_counts.index[:MAX_HEATMAP_SENDERS])]
+    names = list(top_senders)
+    if len(senders) > len(top_senders):
+        names.append("others")
+    codes = pd.Categorical(df['sender'], categories=top_senders).codes.astype(np.int64)
+    codes[codes < 0] = len(top_senders)
+    days = (df['time'].dt.normalize() - start_date).dt.days.values
+    minutes = df['minutes'].values
+    hist, _ = np.histogramdd(np.column_stack([codes, days, minutes]),
+                             bins=[len(names), day_bins, minute_bins],
+                             range=[[-0.5, len(names) - 0.5], [0, period], [0, 1440]])
+
+    x_length = min(max(period * tick_width, 5), MAX_HEATMAP_WIDTH)
+    fig = new_figure(show, figsize=(x_length, HEATMAP_HEIGHT * len(names)))
+    axes = fig.subplots(len(names), 1, sharex=True, squeeze=False)[:, 0]
+    extent = [date2num(start_date), date2num(end_date + datetime.timedelta(1)), 0, 1440]
+    for i, (ax, name) in enumerate(zip(axes, names)):
+        color_map = LinearSegmentedColormap.from_list(str(name), ['white', COLORS[i % len(COLORS)],
+                                                                  EDGE_COLORS[i % len(EDGE_COLORS)]])
+        image = ax.imshow(hist[i].T, origin='lower', aspect='auto', extent=extent, cmap=color_map,
+                          interpolation='nearest')
+        fig.colorbar(image, ax=ax, label="Messages")
+        ax.set_ylim(0, 1440)
+        ax.yaxis.set_major_locator(MultipleLocator(180))
+        ax.yaxis.set_major_formatter(FuncFormatter(m2hm))
+        ax.set_ylabel("Time")
+        ax.set_title(str(name))
+    ax.xaxis_date()
+    ax.xaxis.set_major_locator(AutoDateLocator())
+    ax.xaxis.set_major_formatter(DateFormatter('%d/%m/%Y'))
+    ax.set_xlabel("Date")
+    fig.autofmt_xdate(rotation=90)
+    fig.suptitle("Messages activity.")
+    return fig
+
+
+@instrument.instrumented("plot_amount_messages")
+def plot_amount_messages(data_path, conversation, end_date=None, start_date=30, tick_width=1, show=False,
+                         df=None, labels="auto"):
     """
     Plot the amount of messages a day for the conversation over the specified time period.
 
+    When a bar per day would make the figure wider than MAX_PLOT_WIDTH inches,
+    the messages are counted per week, or per month for even longer periods.
+
     Parameters
     ----------
     data_path : str
@@ -128,23 +508,28 @@ def plot_amount_messages(data_path, conversation, end_date=None, start_date=30,
         If datetime-like: first date to include in analysis.
         If int: Start date will be X days before end_date
     tick_width : float
-        width in inches between consecutive ticks on both axis.
+        width in inches between consecutive bars on the x axis and per ten
+        messages on the y axis.
     show : bool, default to False
         Show the generated plot.
+    df : pandas.DataFrame or None, optional
+        Messages of the conversation as returned by `load_messages`. If None,
+        the aggregate cube written by the parser is used when present, otherwise
+        the messages are loaded from data_path.
+    labels : {"auto", True, False}, default "auto"
+        Write the number of messages on top of every bar segment.
+        "auto" only labels segments that are tall enough for the label to be
+        readable and drops labels altogether when there would be too many.
 
     """
-    messages_path = os.path.join(data_path, "messages/inbox")
-    path = os.path.join(messages_path, conversation)
-    csv_path = os.path.join(path, "message.csv")
+    from matplotlib.dates import AutoDateLocator, ConciseDateFormatter
+    from matplotlib.ticker import MaxNLocator, MultipleLocator
+    import numpy as np
+    import pandas as pd
 
-    df = pd.read_csv(csv_path)
-    df['time'] = pd.to_datetime(df['time'], format="%d %B %Y %H:%M")
-    df = df.sort_values('time')
-    df['date'] = df['time'].dt.normalize()
-    df['minutes'] = df['time'].dt.hour * 60 + df['time'].dt.minute
-    df = df.groupby(['date', 'sender']).size().reset_index(name='amount_messages')
+    counts = _message_counts(data_path, df, chats=[conversation])
 
-    last_date = df['date'].max()
+    last_date = counts['date'].max()
     if end_date is None:
         end_date = last_date
     else:
@@ -153,67 +538,79 @@ def plot_amount_messages(data_path, conversation, end_date=None, start_date=30,
 
     if isinstance(start_date, int):
         days = start_date
-        start_date = max(df['date'].min(), end_date - datetime.timedelta(days))
+        start_date = max(counts['date'].min(), end_date - datetime.timedelta(days))
     else:
         start_date = pd.Timestamp(start_date)
 
-    df = df[df['date'] <= end_date]
-    df = df[df['date'] >= start_date]
+    counts = counts[(counts['date'] <= end_date) & (counts['date'] >= start_date)]
 
     date_range = pd.date_range(start_date, end_date, freq="1D")
 
-    senders = df['sender'].unique()
-
-    index = pd.MultiIndex.from_product([date_range, senders],
-                                       names=["date", "sender"])
-    df.set_index(['date', 'sender'], drop=True, inplace=True)
-    df = df.reindex(index, fill_value=0)
-    df.reset_index(inplace=True)
-    if df.shape[0] <= 1:
+    # Dense date x sender matrix, senders ordered by their first message in the window.
+    senders = counts.sort_values(['date', 'hour'], kind='mergesort')['sender'].drop_duplicates().tolist()
+    counts = counts.pivot_table(index='date', columns='sender', values='count', aggfunc='sum', fill_value=0,
+                                observed=True)
+    counts = counts.reindex(index=date_range, columns=senders, fill_value=0)
+    if counts.size <= 1:
         return
 
-    fig = plt.figure()
-    ax = fig.add_subplot(111)
-    if df.amount_messages.max() < 40:
-        offset = 0
+    period = (end_date - start_date).days
+    if period * tick_width <= MAX_PLOT_WIDTH:
+        frequency, unit = "D", "day"
+    elif period / 7.0 * tick_width <= MAX_PLOT_WIDTH:
+        frequency, unit = "W", "week"
     else:
-        offset = 1
+        frequency, unit = "M", "month"
+    counts = counts.groupby(date_range.to_period(frequency)).sum()
+    days = (counts.index.end_time - counts.index.start_time).days + 1
+    widths = 0.8 * days
+    # Day bars are centred on their date, week and month bars on their middle.
+    dates = counts.index.start_time
+    if frequency != "D":
+        dates = dates + pd.to_timedelta(days / 2.0, unit='D')
+    values = counts.values
+    tops = values.cumsum(axis=1)
+    bottoms = tops - values
+
+    fig = new_figure(show)
+    ax = fig.add_subplot(111)
     for i, sender in enumerate(senders):
-        i = i % len(COLORS)
-        df_sender = df[df['sender'] == sender]
-        dates = df_sender['date'].tolist()
-        if i == 0:
-            ax.bar(dates, df_sender['amount_messages'], color=COLORS[i],
-                   alpha=0.8, label=sender)
-            bottom = np.array(df_sender['amount_messages'].tolist())
-        else:
-            ax.bar(dates, df_sender['amount_messages'], color=COLORS[i], bottom=bottom,
-                   alpha=0.8, label=sender)
-            bottom += np.array(df_sender['amount_messages'].tolist())
-
-        for x, y, value in zip(dates, bottom, df_sender['amount_messages']):
-            if value != 0:
-                ax.text(x, y + offset, str(value))
+        color = COLORS[i % len(COLORS)]
+        ax.bar(dates, values[:, i], width=widths, bottom=bottoms[:, i], color=color, alpha=0.8, label=sender)
 
     ax.xaxis_date()
 
     major_locator = MultipleLocator(10)
     ax.yaxis.set_major_locator(major_locator)
     ax.yaxis.grid(linestyle=':', linewidth=0.5)
-    y_length = max(ax.get_ylim()[1] / 10 * tick_width, 10)
-
-    period = (end_date - start_date).days
-    if period > 366:
-        interval = 7
-    else:
-        interval = 1
-    ax.xaxis.set_major_locator(DayLocator(interval=interval))
-    ax.xaxis.set_major_formatter(DateFormatter('%d/%m/%Y'))
+    y_length = min(max(ax.get_ylim()[1] / 10 * tick_width, 10), MAX_PLOT_HEIGHT)
+    if ax.get_ylim()[1] / 10 > 4 * y_length:
+        # Too many ticks of ten messages for the capped height.
+        ax.yaxis.set_major_locator(MaxNLocator(nbins=int(2 * y_length), steps=[1, 2, 5, 10]))
+
+    if labels:
+        if values.max() < 40:
+            offset = 0
+        else:
+            offset = 1
+        rows, columns = np.nonzero(values)
+        if labels == "auto":
+            inches_per_message = y_length / ax.get_ylim()[1]
+            readable = values[rows, columns] * inches_per_message >= MIN_LABEL_HEIGHT
+            rows, columns = rows[readable], columns[readable]
+            if tick_width < MIN_LABEL_WIDTH or len(rows) > MAX_BAR_LABELS:
+                rows, columns = rows[:0], columns[:0]
+        for x, y, value in zip(dates[rows], tops[rows, columns], values[rows, columns]):
+            ax.text(x, y + offset, str(value))
+
+    x_length = min(max((len(dates) - 1) * tick_width, 5), MAX_PLOT_WIDTH)
+    # At most a date label per inch.
+    locator = AutoDateLocator(minticks=max(int(x_length) // 3, 3), maxticks=max(int(x_length), 3))
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(ConciseDateFormatter(locator))
     ax.xaxis.grid(linestyle=':', linewidth=0.5)
-    x_length = max(period * tick_width, 5)
-    fig.autofmt_xdate(rotation=90)
     fig.set_size_inches(x_length, y_length)
-    plt.title("Amount messages per day.")
+    ax.set_title("Amount messages per {}.".format(unit))
     ax.set_xlabel("Date")
     ax.set_ylabel("Messages")
 
@@ -225,13 +622,10 @@ def plot_amount_messages(data_path, conversation, end_date=None, start_date=30,
 
     file_name = conversation + "_amount_messages.png"
     file_name = os.path.join(output_path, file_name)
-    plt.savefig(file_name, bbox_inches='tight')
+    save_figure(fig, file_name, show)
 
-    if show:
-        plt.show()
-    plt.close()
-
-def message_activity_hourly(data_path, sender, show=False):
+@instrument.instrumented("message_activity_hourly")
+def message_activity_hourly(data_path, sender, show=False, df=None, chunksize=None):
     """
     Plot activity for every hour of the day.
 
@@ -243,26 +637,23 @@ def message_activity_hourly(data_path, sender, show=False):
         Name of the sender of the messages. Recommended to be your own name.
     show : bool, default to False
         Show the generated plot.
+    df : pandas.DataFrame or None, optional
+        Messages of all conversations as returned by `load_messages`. If None,
+        the aggregate cube written by the parser is used when present, otherwise
+        the messages are loaded from data_path.
+    chunksize : int or None, optional
+        Without the aggregate cube, stream the messages in chunks of this many
+        rows instead of loading them all, so memory stays bounded at any export
+        size. See `insights.aggregates.stream_counts`.
 
     """
-    path = os.path.join(data_path, "messages/inbox")
-    directories = os.listdir(path)
-    df = None
-    for directory in directories:
-        directory_path = os.path.join(path, directory)
-        if os.path.isdir(directory_path) and directory not in ["insights", "stickers_used"]:
-            csv_path = os.path.join(directory_path, "message.csv")
-            if os.path.isfile(csv_path):
-                if df is None:
-                    df = pd.read_csv(csv_path)
-                else:
-                    df = df.append(pd.read_csv(csv_path), ignore_index=True)
-    df['time'] = pd.to_datetime(df['time'], format="%d %B %Y %H:%M")
-    df = df.sort_values('time')
-    df['hour'] = df['time'].dt.hour
-    df = df[df['sender'] == sender]
-    grouped = df.groupby(['hour']).size().reset_index(name='amount_messages')
-    fig, ax = plt.subplots(1, 1, figsize=(5, 10))
+    from matplotlib.ticker import MultipleLocator
+
+    counts = _message_counts(data_path, df, chunksize=chunksize, senders=[sender])
+    counts = counts[counts['sender'] == sender]
+    grouped = counts.groupby(['hour'])['count'].sum().reset_index(name='amount_messages')
+    fig = new_figure(show, figsize=(5, 10))
+    ax = fig.add_subplot(111)
     ax.barh(grouped['hour'], grouped['amount_messages'], color="#4286f4")
     major_locator = MultipleLocator(1)
     ax.yaxis.set_major_locator(major_locator)
@@ -276,13 +667,10 @@ def message_activity_hourly(data_path, sender, show=False):
 
     file_name = "message_activity_{}.png".format(sender.replace(" ","_"))
     file_name = os.path.join(output_path, file_name)
-    plt.savefig(file_name, bbox_inches='tight')
-
-    if show:
-        plt.show()
-    plt.close()
+    save_figure(fig, file_name, show)
 
-def message_activity_weekly(data_path, sender, show=False):
+@instrument.instrumented("message_activity_weekly")
+def message_activity_weekly(data_path, sender, show=False, df=None, chunksize=None):
     """
     Plot activity for every day of the week.
 
@@ -294,26 +682,24 @@ def message_activity_weekly(data_path, sender, show=False):
         Name of the sender of the messages. Recommended to be your own name.
     show : bool, default to False
         Show the generated plot.
+    df : pandas.DataFrame or None, optional
+        Messages of all conversations as returned by `load_messages`. If None,
+        the aggregate cube written by the parser is used when present, otherwise
+        the messages are loaded from data_path.
+    chunksize : int or None, optional
+        Without the aggregate cube, stream the messages in chunks of this many
+        rows instead of loading them all, so memory stays bounded at any export
+        size. See `insights.aggregates.stream_counts`.
 
     """
-    path = os.path.join(data_path, "messages")
-    directories = os.listdir(path)
-    df = None
-    for directory in directories:
-        directory_path = os.path.join(path, directory)
-        if os.path.isdir(directory_path) and directory not in ["insights", "stickers_used"]:
-            csv_path = os.path.join(directory_path, "message.csv")
-            if os.path.isfile(csv_path):
-                if df is None:
-                    df = pd.read_csv(csv_path)
-                else:
-                    df = df.append(pd.read_csv(csv_path), ignore_index=True)
-    df['time'] = pd.to_datetime(df['time'], format="%d %B %Y %H:%M")
-    df = df.sort_values('time')
-    df['dayofweek'] = df['time'].dt.dayofweek
-    df = df[df['sender'] == sender]
-    grouped = df.groupby(['dayofweek']).size().reset_index(name='amount_messages')
-    fig, ax = plt.subplots(1, 1, figsize=(10, 5))
+    from matplotlib.ticker import MultipleLocator
+
+    counts = _message_counts(data_path, df, chunksize=chunksize, senders=[sender])
+    counts = counts[counts['sender'] == sender]
+    counts = counts.assign(dayofweek=counts['date'].dt.dayofweek)
+    grouped = counts.groupby(['dayofweek'])['count'].sum().reset_index(name='amount_messages')
+    fig = new_figure(show, figsize=(10, 5))
+    ax = fig.add_subplot(111)
     ax.bar(grouped['dayofweek'], grouped['amount_messages'], color="#4286f4")
     major_locator = MultipleLocator(1)
     ax.yaxis.set_major_locator(major_locator)
@@ -329,18 +715,19 @@ def message_activity_weekly(data_path, sender, show=False):
 
     file_name = "message_activity_weekly_{}.png".format(sender.replace(" ","_"))
     file_name = os.path.join(output_path, file_name)
-    plt.savefig(file_name, bbox_inches='tight')
-
-    if show:
-        plt.show()
-    plt.close()
+    save_figure(fig, file_name, show)
 
 
-def most_active_chat(data_path, tick_width=1, end_date=None, start_date=30, legend="text", show=False):
+@instrument.instrumented("most_active_chat")
+def most_active_chat(data_path, tick_width=1, end_date=None, start_date=30, legend="text", show=False, df=None,
+                     top=1, chunksize=None):
     """
     Plot the most active chat for each day between start and end date.
     Dates on the X-axis, number of messages on the y-axis, and the specific chat is encoded in the color of the bars.
 
+    Chats are identified by their conversation directory and labelled with the
+    first part of its name, or the full name when that is ambiguous.
+
     Parameters
     ----------
     data_path : str
@@ -356,30 +743,25 @@ def most_active_chat(data_path, tick_width=1, end_date=None, start_date=30, lege
         Style for legend.
     show : bool, default to False
         Show the generated plot.
+    df : pandas.DataFrame or None, optional
+        Messages of all conversations as returned by `load_messages`. If None,
+        the aggregate cube written by the parser is used when present, otherwise
+        the messages are loaded from data_path.
+    top : int, default 1
+        Number of most active chats to show for every day, drawn side by side.
+    chunksize : int or None, optional
+        Without the aggregate cube, stream the messages in chunks of this many
+        rows instead of loading them all, see `message_activity_hourly`.
 
     """
-    path = os.path.join(data_path, "messages/inbox")
-    directories = os.listdir(path)
-    df = None
-    for directory in directories:
-        directory_path = os.path.join(path, directory)
-        if os.path.isdir(directory_path) and directory not in ["insights", "stickers_used"]:
-            csv_path = os.path.join(directory_path, "message.csv")
-            if os.path.isfile(csv_path):
-                chat = directory.split('_')[0]
-                new_df = pd.read_csv(csv_path)
-                new_df['chat'] = chat
-                if df is None:
-                    df = new_df
-                else:
-                    df = df.append(new_df, ignore_index=True)
-    df['time'] = pd.to_datetime(df['time'], format="%d %B %Y %H:%M")
-    df['date'] = df['time'].dt.normalize()
-    df = df.groupby(['date', 'chat']).size().reset_index(name='amount_messages')
-    idx = df.groupby(['date'])['amount_messages'].transform(max) == df['amount_messages']
-    df = df[idx].drop_duplicates(subset=['date', 'amount_messages'])
+    from matplotlib.dates import DayLocator, DateFormatter, date2num
+    from matplotlib.ticker import MultipleLocator
+    import numpy as np
+    import pandas as pd
 
-    last_date = df['date'].max()
+    counts = _message_counts(data_path, df, chunksize=chunksize)
+
+    last_date = counts['date'].max()
     if end_date is None:
         end_date = last_date
     else:
@@ -388,25 +770,30 @@ def most_active_chat(data_path, tick_width=1, end_date=None, start_date=30, lege
 
     if isinstance(start_date, int):
         days = start_date
-        start_date = max(df['date'].min(), end_date - datetime.timedelta(days))
+        start_date = max(counts['date'].min(), end_date - datetime.timedelta(days))
     else:
         start_date = pd.Timestamp(start_date)
 
-    df = df[df['date'] <= end_date]
-    df = df[df['date'] >= start_date]
-
-    chats = df.chat.unique()
+    counts = counts[(counts['date'] <= end_date) & (counts['date'] >= start_date)]
+    df, chats = _top_chats_per_day(counts, top)
+    labels = _chat_labels(chats)
     colors = get_colors(len(chats))
 
-    fig, ax = plt.subplots(1, 1)
+    fig = new_figure(show)
+    ax = fig.add_subplot(111)
 
-    for i, chat in enumerate(chats):
-        chat_df = df[df.chat == chat]
-        ax.bar(chat_df['date'].tolist(), chat_df['amount_messages'], color=colors[i], alpha=0.8, label=chat)
+    width = 0.8 / top
+    df['x'] = date2num(df['date']) + (df['rank'] - (top - 1) / 2.0) * width
+    for chat_id in np.unique(df['chat_id']):
+        chat_df = df[df['chat_id'] == chat_id]
+        ax.bar(chat_df['x'], chat_df['amount_messages'], width=width, color=colors[chat_id], alpha=0.8,
+               label=labels[chat_id])
 
     if legend == "text":
-        for x, value in zip(df['date'].tolist(), df['chat']):
-            ax.text(x, len(value) + ax.get_ylim()[1] / 10, value, rotation=90, size=14)
+        for x, chat_id in zip(df['x'], df['chat_id']):
+            value = labels[chat_id]
+            ax.text(x, len(value) + ax.get_ylim()[1] / 10, value, rotation=90, size=14,
+                    horizontalalignment='center')
     if legend == "box":
         ax.legend()
 
@@ -440,10 +827,44 @@ def most_active_chat(data_path, tick_width=1, end_date=None, start_date=30, lege
 
     file_name = "most_active_chat.png"
     file_name = os.path.join(output_path, file_name)
-    plt.savefig(file_name, bbox_inches='tight')
+    save_figure(fig, file_name, show)
+
+    return
+
+
+def _top_chats_per_day(counts, top):
+    """
+    The top most active chats of every day in counts.
+
+    Chats are integer coded once and the daily totals are ranked with a single
+    sort, so the cost does not depend on top.
+
+    Returns
+    -------
+    tuple(pandas.DataFrame, numpy.ndarray)
+        Frame with columns date, chat_id, amount_messages and rank (0 for the
+        most active chat of the day) and the chat names indexed by chat_id.
+    """
+    import numpy as np
+    import pandas as pd
 
-    if show:
-        plt.show()
-    plt.close()
+    codes, chats = pd.factorize(counts['chat'].astype(str), sort=True)
+    daily = pd.DataFrame({'date': counts['date'].values, 'chat_id': codes, 'count': counts['count'].values})
+    daily = daily.groupby(['date', 'chat_id'], sort=False)['count'].sum().reset_index(name='amount_messages')
+    daily = daily.sort_values(['date', 'amount_messages', 'chat_id'], ascending=[True, False, True],
+                              kind='mergesort')
+    daily['rank'] = daily.groupby('date', sort=False).cumcount()
+    daily = daily[daily['rank'] < top].reset_index(drop=True)
+    return daily, np.asarray(chats)
+
+
+def _chat_labels(chats):
+    """
+    Short display name for every chat: the part of the directory name before the
+    first underscore, or the full directory name if other chats share that part.
+    """
+    import pandas as pd
 
-    return
\ No newline at end of file
+    short = [chat.split('_')[0] for chat in chats]
+    counts = pd.Series(short).value_counts()
+    return [name if counts[name] == 1 else chat for name, chat in zip(short, chats)]
@@ -1,84 +1,525 @@
 import argparse
 import csv
+import hashlib
+import io
+import json
 import os
-import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-from bs4 import BeautifulSoup
+from insights import aggregates, archive, files, html_reader, instrument, json_reader, store
 
-def likes_and_reactions(data_path):
+MANIFEST_NAME = "parse_manifest.json"
+
+@instrument.instrumented("parser.likes_and_reactions")
+def likes_and_reactions(data_path, streaming=False, archives=None):
     """
-    Parse likes_and_reactions/posts_and_comments.html to a csv file that can be used
-    in the processing functions.
+    Parse likes_and_reactions/posts_and_comments.html, or posts_and_comments.json
+    for a json export, to a csv file that can be used in the processing functions.
 
     Parameters
     ----------
     data_path : str
         Path to the root directory of your personal facebook data.
+    streaming : bool, default False
+        Read the html in a single pass with an incremental tokenizer instead of
+        building a full BeautifulSoup tree. The csv output is identical.
+    archives : list of str or None, optional
+        Read the source file from these downloaded zip files instead of from
+        data_path, see `messages`. The csv is still written to data_path.
 
     """
     path = os.path.join(data_path, "likes_and_reactions/")
-    html_path = os.path.join(path, "posts_and_comments.html")
-    soup = BeautifulSoup(open(html_path), "html.parser")
     csv_path = os.path.join(path, "posts_and_comments.csv")
+    if archives:
+        members = archive.members(archives)
+        html_source = members.get("likes_and_reactions/posts_and_comments.html")
+        json_source = members.get("likes_and_reactions/posts_and_comments.json")
+        if html_source is None and json_source is None:
+            raise IOError("No likes_and_reactions/posts_and_comments in {}.".format(", ".join(archives)))
+        if not os.path.exists(path):
+            os.makedirs(path)
+    else:
+        html_source = os.path.join(path, "posts_and_comments.html")
+        json_source = os.path.join(path, "posts_and_comments.json")
+        if not os.path.isfile(html_source) and os.path.isfile(json_source):
+            html_source = None
 
-    reg_1 = re.compile(r"^(.*?)(?: like(?:s|d) | reacted to )(.*?)(?:'s| own)")
-    reg_2 = re.compile(r"(\w+)\.png")
+    if html_source is None:
+        rows = _json_reactions(json_source)
+    elif streaming:
+        rows = _stream_reactions(html_source)
+    else:
+        rows = _soup_reactions(html_source)
     with open(csv_path, 'w') as csv_file:
         writer = csv.writer(csv_file, delimiter=",")
         header = ['time', 'reaction', 'liker', 'poster']
         writer.writerow(header)
-        for reaction_div in soup.find_all("div", "pam _3-95 _2pi0 _2lej uiBoxWhite noborder"):
-            reaction_text = reaction_div.find("div", "_3-96 _2pio _2lek _2lel").get_text()
-            liker = reg_1.match(reaction_text).group(1)
-            poster = reg_1.match(reaction_text).group(2)
-            full_reaction = reaction_div.find("div", "_2pin").find("img")['src']
-            reaction = reg_2.search(full_reaction).group(1)
-            time = reaction_div.find("div", "_3-94 _2lem").get_text()
-            writer.writerow([time, reaction, liker, poster])
+        count = 0
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    instrument.add_rows(count)
+
+
+def _soup_reactions(source):
+    from bs4 import BeautifulSoup
+
+    with _open_source(source) as html_file:
+        soup = BeautifulSoup(html_file, "html.parser")
+    for reaction_div in soup.find_all("div", "pam _3-95 _2pi0 _2lej uiBoxWhite noborder"):
+        reaction_text = reaction_div.find("div", "_3-96 _2pio _2lek _2lel").get_text()
+        liker, poster = html_reader.REACTION_PATTERN.match(reaction_text).group(1, 2)
+        full_reaction = reaction_div.find("div", "_2pin").find("img")['src']
+        reaction = html_reader.REACTION_ICON_PATTERN.search(full_reaction).group(1)
+        time = reaction_div.find("div", "_3-94 _2lem").get_text()
+        yield [time, reaction, liker, poster]
+
 
-def messages(data_path):
+def _stream_reactions(source):
+    with _open_source(source) as html_file:
+        for row in html_reader.iter_reactions(html_file):
+            yield row
+
+
+def _json_reactions(source):
+    with _open_source(source, binary=True) as json_file:
+        for row in json_reader.read_reactions(json_file):
+            yield row
+
+@instrument.instrumented("parser.messages")
+def messages(data_path, streaming=False, jobs=1, force=False, output="csv", index=False, archives=None):
     """
     Parse message from conversation to a csv file that can be used
     in the processing functions.
 
+    Both the html export (message.html) and the json export (message.json or
+    message_1.json, message_2.json, ...) are detected per conversation and
+    produce identical output.
+
+    Alongside the messages, the number of messages per date, sender and hour is
+    written to message_counts.csv in every conversation directory and combined
+    in messages/message_counts.csv, see `insights.aggregates`. The person index
+    in messages/people.csv and people_daily.csv is derived from it, see
+    `insights.people`.
+
     Parameters
     ----------
     data_path : str
         Path to the root directory of your personal facebook data.
+    streaming : bool, default False
+        Read message.html with an incremental tokenizer and write rows as they are
+        found instead of building a full BeautifulSoup tree. Memory use stays flat
+        regardless of the conversation size and the csv output is identical.
+    jobs : int, default 1
+        Number of worker processes used to parse conversations in parallel.
+        If None, one worker per cpu is used.
+    force : bool, default False
+        Re-parse every conversation. By default conversations whose source files
+        are unchanged since the last run, according to the manifest in the data
+        root, are skipped.
+    output : {"csv", "store"}, default "csv"
+        "csv" writes a message.csv in every conversation directory.
+        "store" writes all conversations to one consolidated Parquet dataset in
+        messages/store, partitioned by chat and year, with typed columns.
+        Requires pyarrow.
+    index : bool, default False
+        Update the full-text search index in messages/search.sqlite with the
+        conversations that changed since they were last indexed, see
+        `insights.search`.
+    archives : list of str or None, optional
+        Read the conversations straight from these downloaded zip files instead
+        of from an extracted data_path. Every member is decompressed while it is
+        parsed, nothing is extracted to disk. A download split in several parts
+        is read as one export, the parts can be given in any order. The output
+        and manifest are written to data_path as usual, changes are detected
+        with the sizes and checksums stored in the zip files.
+
+    Returns
+    -------
+    list of tuple(str, str)
+        (conversation, error) for every conversation that could not be parsed.
+        A failing conversation does not abort the run and leaves any previous
+        message.csv or store partition untouched, along with its manifest entry
+        and search index rows.
     """
+    if output not in ["csv", "store"]:
+        raise ValueError("output should be 'csv' or 'store'.")
     path = os.path.join(data_path, "messages/inbox")
+    manifest = _load_manifest(data_path)
+    previous = manifest.get(_manifest_key(output), {})
+    current = {}
+    store_data_path = data_path if output == "store" else None
+
+    # A single concurrent scan of the inbox, the file stats are reused for the freshness checks.
+    listing = files.scan(path) if os.path.isdir(path) else {}
+    listed = dict((os.path.join(path, conversation, name), stat) for conversation, names in listing.items()
+                  for name, stat in names.items())
+    if archives:
+        conversation_sources = archive.conversations(archive.members(archives))
+    else:
+        conversation_sources = dict((conversation, _message_sources(os.path.join(path, conversation), names))
+                                    for conversation, names in listing.items())
 
-    conversations = os.listdir(path)
-    for conversation in conversations:
+    conversation_paths = []
+    conversations = []
+    skipped = 0
+    for conversation, sources in conversation_sources.items():
         conversation_path = os.path.join(path, conversation)
-        messages_html_path = os.path.join(conversation_path, "message.html")
-        if os.path.isfile(messages_html_path):
-            print(conversation)
-            print("Loading html source ...")
-            soup = BeautifulSoup(open(messages_html_path), "html.parser")
-            csv_path = os.path.join(conversation_path, "message.csv")
-            print("Writing csv ...")
-            with open(csv_path, 'w') as csv_file:
-                writer = csv.writer(csv_file, delimiter=",")
-                header = ['time', 'sender', 'text']
-                writer.writerow(header)
-                for message_div in soup.select('div[role="main"] > div.pam._3-95._2pi0._2lej.uiBoxWhite.noborder'):
-                    sender_div = message_div.find("div", "_3-96 _2pio _2lek _2lel")
-                    if sender_div:
-                        sender = sender_div.get_text()
-                    else:
-                        sender = "unknown"
-                    time_text = message_div.find("div", "_3-94 _2lem").get_text()
-                    text_div =  message_div.select('div._3-96._2let > div > div')
-                    if len(text_div) > 1:
-                        text = text_div[1].get_text()
-                    else:
-                        text = "unknown"
-                    writer.writerow([time_text, sender, text])
+        if sources:
+            conversations.append(conversation)
+            names = listing.get(conversation, {})
+            if output == "store":
+                output_exists = store.has_conversation(data_path, conversation)
+            else:
+                output_exists = "message.csv" in names
+            output_exists = output_exists and aggregates.COUNTS_NAME in names
+            entry = previous.get(conversation)
+            if not force and output_exists:
+                entry = _fresh_entry(entry, sources, listed)
+                if entry is not None:
+                    current[conversation] = entry
+                    skipped += 1
+                    continue
+            conversation_paths.append((conversation_path, sources))
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
+    total = len(conversation_paths)
+    failures = []
+
+    def report(done, conversation_path, rows, error, entry=None):
+        conversation = os.path.basename(conversation_path)
+        if error is None:
+            print("[{}/{}] {} ({} messages)".format(done, total, conversation, rows))
+            instrument.add_rows(rows)
+            current[conversation] = entry
+        else:
+            print("[{}/{}] {} FAILED: {}".format(done, total, conversation, error))
+            failures.append((conversation, error))
+            # The previous output is left in place, keep describing it so it stays indexed for search.
+            if conversation in previous:
+                current[conversation] = previous[conversation]
+
+    if jobs == 1:
+        # Read the next conversations while the current one is parsed.
+        loaded = files.Prefetcher([sources for _, sources in conversation_paths],
+                                  lambda sources: _read_sources(sources, listed), name="parser.io")
+        for done, ((conversation_path, _), sources) in enumerate(zip(conversation_paths, loaded), 1):
+            rows, error, entry = _parse_conversation(conversation_path, sources, streaming, store_data_path,
+                                                     listed)
+            report(done, conversation_path, rows, error, entry)
+        if total:
+            print(loaded.summary())
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {instrument.submit(executor, _parse_conversation, conversation_path, sources, streaming,
+                                         store_data_path, _listed_stats(sources, listed)): conversation_path
+                       for conversation_path, sources in conversation_paths}
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    rows, error, entry = instrument.result(future)
+                except Exception as e:
+                    # E.g. a worker that was killed, which breaks the pool for the remaining conversations.
+                    rows, error, entry = None, "{}: {}".format(type(e).__name__, e), None
+                report(done, futures[future], rows, error, entry)
+
+    if output == "store":
+        store.prune(data_path, conversations)
+    with instrument.stage("aggregates.build_cube"):
+        aggregates.build_cube(data_path, conversations)
+    with instrument.stage("aggregates.build_people"):
+        aggregates.build_people(data_path)
+    if index:
+        from insights import search
+        indexed = search.update(data_path, dict((conversation, _source_hash(current[conversation]))
+                                                for conversation in conversations if conversation in current))
+        print("Indexed {} conversations for search.".format(indexed))
+    manifest[_manifest_key(output)] = current
+    _save_manifest(data_path, manifest)
+    print("Parsed {} of {} conversations, skipped {} unchanged.".format(total - len(failures), total, skipped))
+    return failures
+
+
+def _manifest_key(output):
+    return "messages" if output == "csv" else "messages_" + output
+
+
+def _load_manifest(data_path):
+    manifest_path = os.path.join(data_path, MANIFEST_NAME)
+    if not os.path.isfile(manifest_path):
+        return {}
+    with open(manifest_path) as manifest_file:
+        try:
+            return json.load(manifest_file)
+        except ValueError:
+            return {}
+
+
+def _save_manifest(data_path, manifest):
+    manifest_path = os.path.join(data_path, MANIFEST_NAME)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def _message_sources(conversation_path, names=None):
+    """
+    Source files of a conversation: message.html for the html export, otherwise
+    the message*.json parts of the json export.
+
+    names are the files in conversation_path if they were already listed.
+    """
+    if names is None:
+        if not os.path.isdir(conversation_path):
+            return []
+        names = os.listdir(conversation_path)
+    if "message.html" in names:
+        return [os.path.join(conversation_path, "message.html")]
+    return json_reader.message_files(conversation_path, names)
+
+
+def _read_sources(sources, listed):
+    """
+    Read the source files of a conversation into memory for the prefetch queue.
+
+    Sources in a zip file or larger than files.PREFETCH_MAX_BYTES together are
+    returned as they are and only opened when they are parsed. So are sources
+    that cannot be read, their error is reported when they are parsed.
+    """
+    if isinstance(sources[0], archive.Member):
+        return sources
+    stats = [listed.get(source_path) for source_path in sources]
+    if None in stats or sum(stat.st_size for stat in stats) > files.PREFETCH_MAX_BYTES:
+        return sources
+    loaded = []
+    for source_path, stat in zip(sources, stats):
+        try:
+            data = files.read_bytes(source_path)
+        except OSError:
+            return sources
+        if data is None:
+            return sources
+        loaded.append(files.Loaded(source_path, data, stat))
+    return loaded
+
+
+def _listed_stats(sources, listed):
+    """
+    The entries of listed for the given sources, to pass to a worker process instead of the whole listing.
+    """
+    return dict((source, listed[source]) for source in sources if isinstance(source, str) and source in listed)
+
+
+def _source_name(source):
+    if isinstance(source, archive.Member):
+        return source.name
+    if isinstance(source, files.Loaded):
+        return source.path
+    return source
+
+
+def _open_source(source, binary=False):
+    """
+    Open a source file, either a path, an `insights.archive.Member` or an
+    `insights.files.Loaded` file that was already read.
+    """
+    if isinstance(source, archive.Member):
+        return archive.open_member(source, binary=binary)
+    if isinstance(source, files.Loaded):
+        source_file = io.BytesIO(source.data)
+        return source_file if binary else io.TextIOWrapper(source_file)
+    return open(source, 'rb' if binary else 'r')
+
+
+def _source_stat(source_paths, listed=None):
+    stats = [(listed or {}).get(source_path) or os.stat(source_path) for source_path in source_paths]
+    return sum(stat.st_size for stat in stats), max(stat.st_mtime for stat in stats)
+
+
+def _source_entry(source_paths, listed=None):
+    """
+    Total size, latest mtime and combined content hash of the source files of a
+    conversation as stored in the manifest.
+    """
+    if isinstance(source_paths[0], archive.Member):
+        return archive.source_entry(source_paths)
+    if isinstance(source_paths[0], files.Loaded):
+        stats = [source.stat for source in source_paths]
+        digest = hashlib.sha1()
+        for source in source_paths:
+            digest.update(source.data)
+        return {"size": sum(stat.st_size for stat in stats), "mtime": max(stat.st_mtime for stat in stats),
+                "sha1": digest.hexdigest()}
+    size, mtime = _source_stat(source_paths, listed)
+    digest = hashlib.sha1()
+    for source_path in source_paths:
+        with open(source_path, 'rb') as source_file:
+            for block in iter(lambda: source_file.read(1 << 20), b""):
+                digest.update(block)
+    return {"size": size, "mtime": mtime, "sha1": digest.hexdigest()}
+
+
+def _source_hash(entry):
+    """
+    Content hash of a manifest entry, the sha1 of extracted files or the
+    combined CRC-32 of archive members.
+    """
+    return entry.get("sha1") or entry.get("crc32")
+
+
+def _fresh_entry(entry, source_paths, listed=None):
+    """
+    Return an up to date manifest entry if source_paths are unchanged since entry
+    was recorded, None if they need to be parsed again.
+
+    Matching size and mtime are trusted, a differing mtime falls back to
+    comparing the content hash so touched but identical files are not re-parsed.
+    listed maps source paths to their os.stat_result if they were already listed.
+    """
+    if entry is None:
+        return None
+    if isinstance(source_paths[0], archive.Member):
+        new_entry = archive.source_entry(source_paths)
+        return entry if new_entry == entry else None
+    size, mtime = _source_stat(source_paths, listed)
+    if size != entry.get("size"):
+        return None
+    if mtime == entry.get("mtime"):
+        return entry
+    new_entry = _source_entry(source_paths, listed)
+    if new_entry["sha1"] != entry.get("sha1"):
+        return None
+    return new_entry
+
+
+def _parse_conversation(conversation_path, sources, streaming, store_data_path=None, listed=None):
+    """
+    Write message.csv, or the store partition if store_data_path is given,
+    for a single conversation directory from its sources, see `_message_sources`.
+
+    The output is written to a temporary location that replaces the previous
+    output only once it is complete. Returns (number of messages, None,
+    manifest entry of the sources) or (None, error description, None), so
+    workers hash the sources instead of the parent process.
+    """
+    with instrument.stage("parser.conversation", conversation=os.path.basename(conversation_path)):
+        entry = None
+        try:
+            count, error = _write_conversation(conversation_path, sources, streaming, store_data_path)
+            if error is None:
+                entry = _source_entry(sources, listed)
+        except Exception as e:
+            count, error = None, "{}: {}".format(type(e).__name__, e)
+        if count is not None:
+            instrument.add_rows(count)
+    return count, error, entry
+
+
+def _write_conversation(conversation_path, sources, streaming, store_data_path):
+    csv_path = os.path.join(conversation_path, "message.csv")
+    tmp_path = csv_path + ".tmp"
+    if not os.path.exists(conversation_path):
+        os.makedirs(conversation_path)
+    if not _source_name(sources[0]).endswith(".html"):
+        rows = _json_messages(sources)
+    elif streaming:
+        rows = _stream_messages(sources[0])
+    else:
+        rows = _soup_messages(sources[0])
+    counter = Counter()
+    rows = aggregates.count_rows(rows, counter)
+    if store_data_path is not None:
+        try:
+            count = store.write_conversation(store_data_path, os.path.basename(conversation_path), rows)
+            aggregates.write_conversation_counts(conversation_path, counter)
+        except Exception as e:
+            return None, "{}: {}".format(type(e).__name__, e)
+        return count, None
+    try:
+        count = 0
+        with open(tmp_path, 'w') as csv_file:
+            writer = csv.writer(csv_file, delimiter=",")
+            header = ['time', 'sender', 'text']
+            writer.writerow(header)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        os.replace(tmp_path, csv_path)
+        aggregates.write_conversation_counts(conversation_path, counter)
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None, "{}: {}".format(type(e).__name__, e)
+    return count, None
+
+
+def _soup_messages(source):
+    from bs4 import BeautifulSoup
+
+    with _open_source(source) as html_file:
+        soup = BeautifulSoup(html_file, "html.parser")
+    for message_div in soup.select('div[role="main"] > div.pam._3-95._2pi0._2lej.uiBoxWhite.noborder'):
+        sender_div = message_div.find("div", "_3-96 _2pio _2lek _2lel")
+        if sender_div:
+            sender = sender_div.get_text()
+        else:
+            sender = "unknown"
+        time_text = message_div.find("div", "_3-94 _2lem").get_text()
+        text_div =  message_div.select('div._3-96._2let > div > div')
+        if len(text_div) > 1:
+            text = text_div[1].get_text()
+        else:
+            text = "unknown"
+        yield [time_text, sender, text]
+
+
+def _stream_messages(source):
+    with _open_source(source) as html_file:
+        for row in html_reader.iter_messages(html_file):
+            yield row
+
+
+def _json_messages(sources):
+    for source in sources:
+        with _open_source(source, binary=True) as json_file:
+            for row in json_reader.read_messages(json_file):
+                yield row
+
+def add_arguments(parser):
+    """
+    Add the command line arguments of the parser to an argparse parser.
+    """
     parser.add_argument('path', type=str,
                         help='path to the root directory of the downloaded Facebook data.')
-    args = parser.parse_args()
-    messages(args.path)
\ No newline at end of file
+    parser.add_argument('--archive', type=str, nargs='+', default=None, metavar='ZIP',
+                        help='read the data from these downloaded zip files, path is where the output goes.')
+    parser.add_argument('--streaming', action='store_true',
+                        help='parse html files with the streaming tokenizer.')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='number of conversations to parse in parallel (0 for one per cpu).')
+    parser.add_argument('--force', action='store_true',
+                        help='re-parse conversations even if their source files are unchanged.')
+    parser.add_argument('--output', choices=['csv', 'store'], default='csv',
+                        help='write a message.csv per conversation or one consolidated Parquet store.')
+    parser.add_argument('--likes', action='store_true',
+                        help='also parse likes_and_reactions/posts_and_comments.html.')
+    parser.add_argument('--index', action='store_true',
+                        help='update the full-text search index of the messages.')
+    parser.add_argument('--trace', type=str, default=None,
+                        help='write the time spent per stage to this file in the Chrome trace format.')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='run this stage, e.g. parser.conversation, under cProfile.')
+
+
+def main(args):
+    with instrument.trace(args.trace, profile=args.profile, summary=bool(args.trace or args.profile)):
+        if args.likes:
+            likes_and_reactions(args.path, streaming=args.streaming, archives=args.archive)
+        messages(args.path, streaming=args.streaming, jobs=args.jobs or None, force=args.force,
+                 output=args.output, index=args.index, archives=args.archive)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    main(parser.parse_args())
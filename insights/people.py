@@ -0,0 +1,303 @@
+import os
+
+from insights import aggregates, instrument
+from insights.utils import new_figure, save_figure
+import numpy as np
+import pandas as pd
+
+
+_memory_cache = {}
+
+
+@instrument.instrumented("people.load_index")
+def load_index(data_path):
+    """
+    Load the person index written by the parser.
+
+    The index is small compared to the messages, it only holds a row per sender
+    and chat and per sender and day, and is memoized in process until the parser
+    rewrites it, so the functions below answer in milliseconds.
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the root directory of your personal facebook data.
+
+    Returns
+    -------
+    dict
+        "chats": pandas.DataFrame indexed by sender with columns chat, messages,
+        first_seen and last_seen, the chats of every sender most active first.
+        "daily": pandas.DataFrame indexed by sender with columns date and count.
+    """
+    paths = [os.path.join(data_path, aggregates.PEOPLE_NAME), os.path.join(data_path, aggregates.PEOPLE_DAILY_NAME)]
+    if not all(os.path.isfile(path) for path in paths):
+        raise IOError("No person index in {}, parse the messages first.".format(data_path))
+    key = os.path.abspath(paths[0])
+    mtimes = tuple(os.stat(path).st_mtime_ns for path in paths)
+    cached = _memory_cache.get(key)
+    if cached is not None and cached[0] == mtimes:
+        return cached[1]
+
+    chats = pd.read_csv(paths[0], dtype={'sender': str, 'chat': 'category', 'messages': np.int64},
+                        keep_default_na=False)
+    daily = pd.read_csv(paths[1], dtype={'sender': str, 'count': np.int32}, keep_default_na=False)
+    for df, columns in [(chats, ['first_seen', 'last_seen']), (daily, ['date'])]:
+        for column in columns:
+            df[column] = pd.to_datetime(df[column], format="%Y-%m-%d")
+    instrument.add_rows(len(chats) + len(daily))
+    index = {'chats': chats.set_index('sender'), 'daily': daily.set_index('sender')}
+    _memory_cache[key] = (mtimes, index)
+    return index
+
+
+def _rows(table, sender):
+    if sender not in table.index:
+        raise ValueError("No messages of {}.".format(sender))
+    return table.loc[[sender]].reset_index(drop=True)
+
+
+def chats(data_path, sender):
+    """
+    The chats sender wrote in, most messages first.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns chat, messages, first_seen and last_seen.
+    """
+    return _rows(load_index(data_path)['chats'], sender)
+
+
+def daily_messages(data_path, sender, start_date=None, end_date=None):
+    """
+    Messages of sender per day over all chats, only the days sender wrote on.
+
+    Parameters
+    ----------
+    start_date, end_date : str, datetime.date or None, optional
+        Only return the days in this range (inclusive).
+
+    Returns
+    -------
+    pandas.Series
+        Number of messages indexed by date.
+    """
+    daily = _rows(load_index(data_path)['daily'], sender).set_index('date')['count']
+    if start_date is not None:
+        daily = daily[daily.index >= pd.Timestamp(start_date)]
+    if end_date is not None:
+        daily = daily[daily.index <= pd.Timestamp(end_date)]
+    return daily
+
+
+def person(data_path, sender):
+    """
+    Summary of sender over all chats.
+
+    Returns
+    -------
+    pandas.Series
+        messages, chats, first_seen, last_seen and active_days.
+    """
+    sender_chats = chats(data_path, sender)
+    return pd.Series({
+        'messages': sender_chats['messages'].sum(),
+        'chats': len(sender_chats),
+        'first_seen': sender_chats['first_seen'].min(),
+        'last_seen': sender_chats['last_seen'].max(),
+        'active_days': len(load_index(data_path)['daily'].loc[[sender]]),
+    }, name=sender)
+
+
+def contacts(data_path, sender, top=None):
+    """
+    The people sender shares chats with, from the sender by chat graph.
+
+    Parameters
+    ----------
+    top : int or None, optional
+        Only return the top contacts with the most messages in the shared chats.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Indexed by contact with columns shared_chats and messages, the messages
+        the contact wrote in those chats, most messages first.
+    """
+    graph = load_index(data_path)['chats']
+    shared = _rows(graph, sender)['chat']
+    edges = graph[graph['chat'].isin(shared) & (graph.index != sender)]
+    result = edges.groupby(level='sender').agg(shared_chats=('chat', 'size'), messages=('messages', 'sum'))
+    result = result.sort_values(['messages', 'shared_chats'], ascending=False, kind='mergesort')
+    return result.head(top) if top is not None else result
+
+
+def people(data_path, likes=False):
+    """
+    Every sender with their messages, chats, first and last seen date.
+
+    Parameters
+    ----------
+    likes : bool, default False
+        Join the number of your likes of their posts from the parsed
+        likes_and_reactions, posters you never messaged are added with 0 messages.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Indexed by name, most messages first.
+    """
+    graph = load_index(data_path)['chats']
+    grouped = graph.groupby(level='sender')
+    result = grouped.agg(messages=('messages', 'sum'), chats=('chat', 'size'), first_seen=('first_seen', 'min'),
+                         last_seen=('last_seen', 'max'))
+    if likes:
+        result = join_likes(data_path, result)
+    return result.sort_values('messages', ascending=False, kind='mergesort')
+
+
+def join_likes(data_path, df, counts=None):
+    """
+    Join the number of likes per poster to a frame indexed by name.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Indexed by name, e.g. from `people`.
+    counts : pandas.Series or None, optional
+        Number of likes per poster. If None, they are counted from the likes
+        loaded from data_path.
+
+    Returns
+    -------
+    pandas.DataFrame
+        df with an added likes column, outer joined so posters that are not in
+        df get a row as well.
+    """
+    from insights.likes_and_reactions import _poster_counts, load_likes
+
+    if counts is None:
+        counts = _poster_counts(load_likes(data_path, lean=True))
+    counts = pd.Series(counts.values, index=counts.index.astype(str))
+    df = df.join(counts.rename('likes'), how='outer')
+    df['likes'] = df['likes'].fillna(0).astype(np.int64)
+    for column in ['messages', 'chats']:
+        if column in df.columns:
+            df[column] = df[column].fillna(0).astype(np.int64)
+    df.index.name = 'name'
+    return df
+
+
+def co_occurrence(data_path, senders=None, top=20):
+    """
+    Number of chats every pair of senders shares.
+
+    Parameters
+    ----------
+    senders : list of str or None, optional
+        The senders to include, if None the top senders with the most messages.
+    top : int, default 20
+        Number of senders to include when senders is None.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Symmetric senders by senders frame, the diagonal holds the number of
+        chats of every sender.
+    """
+    graph = load_index(data_path)['chats']
+    if senders is None:
+        senders = graph.groupby(level='sender')['messages'].sum().sort_values(ascending=False, kind='mergesort')
+        senders = senders.head(top).index
+    edges = graph[graph.index.isin(senders)]
+    incidence = pd.crosstab(edges.index, edges['chat'].astype(str)).reindex(senders, fill_value=0)
+    incidence = (incidence.values > 0).astype(np.int32)
+    return pd.DataFrame(incidence.dot(incidence.T), index=senders, columns=senders)
+
+
+@instrument.instrumented("plot_person")
+def plot_person(data_path, sender, top=15, show=False):
+    """
+    Plot the messages of sender per month and per chat.
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the root directory of your personal facebook data.
+    sender : str
+        Name of the person.
+    top : int, default 15
+        Number of chats with the most messages of sender to show.
+    show : bool, default to False
+        Show the generated plot.
+
+    """
+    from insights.messages import _chat_labels
+
+    monthly = daily_messages(data_path, sender).resample('MS').sum()
+    sender_chats = chats(data_path, sender).head(top)
+    summary = person(data_path, sender)
+
+    fig = new_figure(show, figsize=(10, 4 + 0.3 * len(sender_chats)))
+    ax_time, ax_chats = fig.subplots(2, 1, gridspec_kw={'height_ratios': [1, max(1, len(sender_chats) / 8.0)]})
+    fig.subplots_adjust(hspace=0.4)
+    ax_time.bar(monthly.index, monthly.values, width=25, align='edge', color="#4286f4", alpha=0.8)
+    ax_time.xaxis_date()
+    ax_time.yaxis.grid(linestyle=':', alpha=0.6)
+    ax_time.set_ylabel("Messages per month")
+    ax_time.set_title("{}: {} messages in {} chats, {:%d %B %Y} to {:%d %B %Y}".format(
+        sender, summary['messages'], summary['chats'], summary['first_seen'], summary['last_seen']))
+
+    positions = np.arange(len(sender_chats))
+    ax_chats.barh(positions, sender_chats['messages'].values, color="#f4a142")
+    ax_chats.set_yticks(positions)
+    ax_chats.set_yticklabels(_chat_labels([str(chat) for chat in sender_chats['chat']]))
+    ax_chats.invert_yaxis()
+    ax_chats.xaxis.grid(linestyle=':', alpha=0.6)
+    ax_chats.set_xlabel("Messages")
+
+    output_path = os.path.join(data_path, "output")
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+
+    file_name = "person_{}.png".format(sender.replace(" ", "_"))
+    file_name = os.path.join(output_path, file_name)
+    save_figure(fig, file_name, show)
+
+
+@instrument.instrumented("plot_co_occurrence")
+def plot_co_occurrence(data_path, senders=None, top=20, show=False):
+    """
+    Plot the number of chats every pair of the most active senders shares.
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the root directory of your personal facebook data.
+    senders : list of str or None, optional
+        The senders to include, if None the top senders with the most messages.
+    top : int, default 20
+        Number of senders to include when senders is None.
+    show : bool, default to False
+        Show the generated plot.
+
+    """
+    from matplotlib.ticker import FixedLocator
+
+    shared = co_occurrence(data_path, senders=senders, top=top)
+    size = len(shared)
+    fig = new_figure(show, figsize=(max(6, 0.4 * size + 3), max(5, 0.4 * size + 2)))
+    ax = fig.add_subplot(111)
+    image = ax.imshow(shared.values, cmap='Blues', interpolation='nearest')
+    ax.xaxis.set_major_locator(FixedLocator(range(size)))
+    ax.set_xticklabels(shared.columns, rotation=90)
+    ax.yaxis.set_major_locator(FixedLocator(range(size)))
+    ax.set_yticklabels(shared.index)
+    fig.colorbar(image, ax=ax, label='Shared chats')
+    ax.set_title("Shared chats")
+
+    output_path = os.path.join(data_path, "output")
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+    save_figure(fig, os.path.join(output_path, "co_occurrence.png"), show)
@@ -0,0 +1,234 @@
+import argparse
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from insights import instrument
+
+
+def report(data_path, sender=None, end_date=None, start_date=30, tick_width=1, jobs=1, skip_fresh=False,
+           timeout=None, dashboard=False):
+    """
+    Render every per-conversation and global plot from a single load of the data.
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the root directory of your personal facebook data.
+    sender : str or None, optional
+        Name used for the hourly and weekly activity plots. Recommended to be your
+        own name. These plots are skipped if None.
+    end_date : datetime-like or None, optional
+        Last date to include in the per-conversation and most active chat plots.
+    start_date : datetime-like or int, optional
+        If datetime-like: first date to include in analysis.
+        If int: Start date will be X days before end_date
+    tick_width : float
+        width in inches between consecutive ticks on both axis.
+    jobs : int or None, default 1
+        Number of worker processes used to render figures. If None, one worker per cpu.
+    skip_fresh : bool, default False
+        Do not render plots whose output png is newer than the data it is made from.
+    timeout : float or None, optional
+        Maximum wall time in seconds for a single figure. Figures that take longer
+        are aborted and reported as failures.
+    dashboard : bool, default False
+        Also write output/dashboard.html from the same load of the data, see
+        `insights.dashboard.dashboard`.
+
+    Returns
+    -------
+    dict
+        Number of "rendered" and "skipped" figures and a list of (figure, error) "failures".
+    """
+    from insights import likes_and_reactions, messages, sessions
+
+    df = messages.load_messages(data_path, columns=['time', 'sender', 'chat'], lean=True)
+    if dashboard:
+        from insights.dashboard import dashboard as write_dashboard
+        write_dashboard(data_path, sender=sender, df=df)
+    output_path = os.path.join(data_path, "output")
+    plot_kwargs = dict(data_path=data_path, end_date=end_date, start_date=start_date, tick_width=tick_width)
+
+    chat_sources = messages.source_files(data_path)
+    tasks = []
+    for chat, chat_df in df.groupby('chat', sort=True):
+        sources = chat_sources.get(chat, [])
+        tasks.append((messages.plot_messages, dict(plot_kwargs, conversation=chat, df=chat_df),
+                      os.path.join(output_path, chat + "_messages.png"), sources))
+        tasks.append((messages.plot_amount_messages, dict(plot_kwargs, conversation=chat, df=chat_df),
+                      os.path.join(output_path, chat + "_amount_messages.png"), sources))
+
+    sources = [source_path for paths in chat_sources.values() for source_path in paths]
+    tasks.append((messages.most_active_chat, dict(plot_kwargs, df=df[['time', 'chat']]),
+                  os.path.join(output_path, "most_active_chat.png"), sources))
+    if sender is not None:
+        sender_name = sender.replace(" ", "_")
+        activity_kwargs = dict(data_path=data_path, sender=sender, df=df[['time', 'sender']])
+        tasks.append((messages.message_activity_hourly, activity_kwargs,
+                      os.path.join(output_path, "message_activity_{}.png".format(sender_name)), sources))
+        tasks.append((messages.message_activity_weekly, activity_kwargs,
+                      os.path.join(output_path, "message_activity_weekly_{}.png".format(sender_name)), sources))
+        sessions_kwargs = dict(data_path=data_path, sender=sender, df=df)
+        tasks.append((sessions.plot_reply_times, sessions_kwargs,
+                      os.path.join(output_path, "reply_times_{}.png".format(sender_name)), sources))
+        tasks.append((sessions.plot_initiation_rates, sessions_kwargs,
+                      os.path.join(output_path, "initiation_rates_{}.png".format(sender_name)), sources))
+
+    likes_path = os.path.join(data_path, "likes_and_reactions")
+    likes_csv_path = os.path.join(likes_path, "posts_and_comments.csv")
+    if os.path.isfile(likes_csv_path):
+        tasks.append((likes_and_reactions.like_statistics, dict(data_path=data_path, lean=True),
+                      os.path.join(likes_path, "insights", "likes_statistics.png"), [likes_csv_path]))
+
+    skipped = 0
+    if skip_fresh:
+        stale_tasks = []
+        for task in tasks:
+            if _is_fresh(task[2], task[3]):
+                skipped += 1
+            else:
+                stale_tasks.append(task)
+        tasks = stale_tasks
+
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+
+    total = len(tasks)
+    done = []
+    failures = []
+
+    def progress(output_file, elapsed, error):
+        name = os.path.basename(output_file)
+        done.append(name)
+        if error is None:
+            print("[{}/{}] {} ({:.1f}s)".format(len(done), total, name, elapsed))
+        else:
+            print("[{}/{}] {} FAILED: {}".format(len(done), total, name, error))
+            failures.append((name, error))
+
+    if jobs == 1:
+        for function, kwargs, output_file, _ in tasks:
+            elapsed, error = _render(function, kwargs, timeout)
+            progress(output_file, elapsed, error)
+    else:
+        _render_parallel(tasks, jobs or os.cpu_count() or 1, timeout, progress)
+
+    print("Rendered {} of {} figures, skipped {} up to date.".format(total - len(failures), total, skipped))
+    return {"rendered": total - len(failures), "skipped": skipped, "failures": failures}
+
+
+def _render_parallel(tasks, jobs, timeout, progress):
+    """
+    Render tasks in a process pool, calling progress(output file, elapsed, error) for every figure.
+
+    A worker that dies while rendering, e.g. killed when it runs out of memory,
+    breaks the whole pool. The figures that were not rendered yet are then
+    resubmitted to a fresh pool, except those that may have been running when
+    it broke: these are rendered one by one in a pool of their own, so only the
+    figure that crashed its worker again is reported as failed.
+    """
+    remaining = tasks
+    while remaining:
+        left = _render_pool(remaining, jobs, timeout, progress)
+        # Tasks are dispatched in order and at most one more than the number of
+        # workers is queued, so only the first unfinished tasks can have started.
+        suspects, remaining = left[:jobs + 1], left[jobs + 1:]
+        for task in suspects:
+            if _render_pool([task], 1, timeout, progress):
+                progress(task[2], 0, "BrokenProcessPool: the worker process rendering it died")
+
+
+def _render_pool(tasks, jobs, timeout, progress):
+    """
+    Render tasks in one process pool, returns the tasks that were not rendered because the pool broke.
+    """
+    finished = set()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as executor:
+        futures = {instrument.submit(executor, _render, function, kwargs, timeout): index
+                   for index, (function, kwargs, _, _) in enumerate(tasks)}
+        for future in as_completed(futures):
+            try:
+                elapsed, error = instrument.result(future)
+            except BrokenProcessPool:
+                continue
+            except Exception as e:
+                elapsed, error = 0, "{}: {}".format(type(e).__name__, e)
+            finished.add(futures[future])
+            progress(tasks[futures[future]][2], elapsed, error)
+    return [task for index, task in enumerate(tasks) if index not in finished]
+
+
+def _is_fresh(output_file, source_paths):
+    if not os.path.isfile(output_file) or not source_paths:
+        return False
+    newest_source = max(os.path.getmtime(source_path) for source_path in source_paths)
+    return os.path.getmtime(output_file) > newest_source
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def _raise_timeout(signum, frame):
+    raise TimeoutError("figure took longer than the time limit")
+
+
+def _render(function, kwargs, timeout):
+    """
+    Render a single figure, returns (elapsed seconds, None) or (elapsed seconds, error description).
+    """
+    use_alarm = timeout is not None and hasattr(signal, "setitimer")
+    if use_alarm:
+        previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    start = time.time()
+    try:
+        function(**kwargs)
+        error = None
+    except Exception as e:
+        error = "{}: {}".format(type(e).__name__, e)
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+    return time.time() - start, error
+
+
+def add_arguments(parser):
+    """
+    Add the command line arguments of the report to an argparse parser.
+    """
+    parser.add_argument('path', type=str,
+                        help='path to the root directory of the downloaded Facebook data.')
+    parser.add_argument('--sender', type=str, default=None,
+                        help='your own name, used for the hourly and weekly activity plots.')
+    parser.add_argument('--days', type=int, default=30,
+                        help='number of days to include in the date based plots.')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='number of figures to render in parallel (0 for one per cpu).')
+    parser.add_argument('--skip-fresh', action='store_true',
+                        help='skip plots whose png is newer than the data it is made from.')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='maximum number of seconds to spend on a single figure.')
+    parser.add_argument('--dashboard', action='store_true',
+                        help='also write output/dashboard.html with zoomable charts.')
+    parser.add_argument('--trace', type=str, default=None,
+                        help='write the time spent per stage to this file in the Chrome trace format.')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='run this stage, e.g. plot_messages, under cProfile.')
+
+
+def main(args):
+    with instrument.trace(args.trace, profile=args.profile, summary=bool(args.trace or args.profile)):
+        report(args.path, sender=args.sender, start_date=args.days, jobs=args.jobs or None,
+               skip_fresh=args.skip_fresh, timeout=args.timeout, dashboard=args.dashboard)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    main(parser.parse_args())
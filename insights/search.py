@@ -0,0 +1,271 @@
+import csv
+import datetime
+import os
+import re
+import sqlite3
+
+from insights import instrument, store
+from insights.utils import get_colors, new_figure, save_figure
+
+
+INDEX_NAME = "messages/search.sqlite"
+PERIODS = {"year": "%Y", "month": "%Y-%m", "day": "%Y-%m-%d"}
+
+
+def index_path(data_path):
+    return os.path.join(data_path, INDEX_NAME)
+
+
+def exists(data_path):
+    return os.path.isfile(index_path(data_path))
+
+
+def connect(data_path):
+    """
+    Open the full-text index of data_path, creating it if it does not exist.
+
+    The index is a SQLite FTS5 table with one row per message. Only the text is
+    tokenized (case and diacritics insensitive), chat, sender and time, as
+    "YYYY-MM-DD HH:MM", are stored with every posting. The chats table keeps the
+    rowid range of every indexed conversation so it can be replaced cheaply, and
+    the hash of the source files it was indexed from.
+    """
+    connection = sqlite3.connect(index_path(data_path))
+    connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5("
+                       "text, chat UNINDEXED, sender UNINDEXED, time UNINDEXED, "
+                       "tokenize='unicode61 remove_diacritics 2')")
+    connection.execute("CREATE TABLE IF NOT EXISTS chats (chat TEXT PRIMARY KEY, first_row INTEGER, "
+                       "last_row INTEGER, source TEXT)")
+    if "source" not in [row[1] for row in connection.execute("PRAGMA table_info(chats)")]:
+        # Indexes written before the hashes were stored are re-indexed once.
+        connection.execute("ALTER TABLE chats ADD COLUMN source TEXT")
+    return connection
+
+
+@instrument.instrumented("search.update")
+def update(data_path, sources):
+    """
+    Bring the index in line with the parsed conversations.
+
+    Conversations whose source hash differs from the one they were indexed
+    with, or that are not yet in the index, are (re)indexed from their
+    message.csv or store partition. Conversations not in sources are removed.
+    As the hashes are stored in the index, conversations that were parsed
+    again in runs without an index update are still picked up.
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the root directory of your personal facebook data.
+    sources : dict
+        Name of every parsed conversation directory to the hash of its source
+        files, as stored in the parse manifest.
+
+    Returns
+    -------
+    int
+        Number of conversations that were indexed.
+    """
+    connection = connect(data_path)
+    try:
+        indexed = dict(connection.execute("SELECT chat, source FROM chats"))
+        for conversation in sorted(set(indexed) - set(sources)):
+            with connection:
+                _remove(connection, conversation)
+        todo = sorted(conversation for conversation, source in sources.items()
+                      if conversation not in indexed or indexed[conversation] != source)
+        for conversation in todo:
+            with connection:
+                _remove(connection, conversation)
+                _add(connection, conversation, _conversation_rows(data_path, conversation), sources[conversation])
+        return len(todo)
+    finally:
+        connection.close()
+
+
+def _remove(connection, conversation):
+    row = connection.execute("SELECT first_row, last_row FROM chats WHERE chat = ?", (conversation,)).fetchone()
+    if row is None:
+        return
+    if row[0] is not None:
+        connection.execute("DELETE FROM messages WHERE rowid BETWEEN ? AND ?", row)
+    connection.execute("DELETE FROM chats WHERE chat = ?", (conversation,))
+
+
+def _add(connection, conversation, rows, source):
+    first_row = connection.execute("SELECT coalesce(max(rowid), 0) + 1 FROM messages").fetchone()[0]
+    cursor = connection.executemany("INSERT INTO messages (text, chat, sender, time) VALUES (?, ?, ?, ?)",
+                                    ((text, conversation, sender, time) for time, sender, text in rows))
+    count = cursor.rowcount
+    instrument.add_rows(count)
+    last_row = first_row + count - 1 if count > 0 else None
+    connection.execute("INSERT INTO chats (chat, first_row, last_row, source) VALUES (?, ?, ?, ?)",
+                       (conversation, first_row if count > 0 else None, last_row, source))
+
+
+def _conversation_rows(data_path, conversation):
+    """
+    (time, sender, text) of every message of a parsed conversation, time as "YYYY-MM-DD HH:MM".
+    """
+    if store.exists(data_path):
+        df = store.read_messages(data_path, chats=[conversation], columns=['time', 'sender', 'text'])
+        times = df['time'].dt.strftime("%Y-%m-%d %H:%M")
+        for time, sender, text in zip(times, df['sender'].astype(str), df['text']):
+            yield time, sender, text
+        return
+
+    csv_path = os.path.join(data_path, "messages/inbox", conversation, "message.csv")
+    dates = {}
+    with open(csv_path) as csv_file:
+        reader = csv.reader(csv_file, delimiter=",")
+        next(reader)
+        for time_text, sender, text in reader:
+            date_text, hour_minute = time_text.rsplit(" ", 1)
+            date = dates.get(date_text)
+            if date is None:
+                date = dates[date_text] = datetime.datetime.strptime(date_text, "%d %B %Y").date().isoformat()
+            yield "{} {:0>5}".format(date, hour_minute), sender, text
+
+
+def search(data_path, query, chats=None, senders=None, limit=None):
+    """
+    Messages matching a full-text query.
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the root directory of your personal facebook data.
+    query : str
+        FTS5 query: words match case and accent insensitive, "a phrase" in double
+        quotes matches the words in order, word* matches a prefix and AND, OR and
+        NOT combine terms.
+    chats : list of str or None, optional
+        Only return messages of these conversation directories.
+    senders : list of str or None, optional
+        Only return messages of these senders.
+    limit : int or None, optional
+        Return at most this many messages, the most recent first.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns time (datetime64), chat, sender and text, sorted by time.
+    """
+    import pandas as pd
+
+    sql, parameters = _match(query, chats, senders, "time, chat, sender, text")
+    sql += " ORDER BY time DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        parameters.append(int(limit))
+    df = _read_sql(data_path, sql, parameters)
+    df['time'] = pd.to_datetime(df['time'], format="%Y-%m-%d %H:%M")
+    return df.iloc[::-1].reset_index(drop=True)
+
+
+def term_frequency(data_path, query, period="month", chats=None, senders=None):
+    """
+    Number of messages matching query per period and chat.
+
+    Parameters
+    ----------
+    period : {"year", "month", "day"}, default "month"
+        Length of the periods the matches are counted in.
+
+    Other parameters are as in `search`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Number of matching messages, indexed by the start of the period with one
+        column per chat that has matches.
+    """
+    import pandas as pd
+
+    if period not in PERIODS:
+        raise ValueError("period should be one of {}.".format(", ".join(sorted(PERIODS))))
+    # Every directive expands to two characters more than it takes, e.g. %Y-%m to 2018-05.
+    columns = "substr(time, 1, {}) AS period, chat, count(*) AS count".format(len(PERIODS[period]) + 2)
+    sql, parameters = _match(query, chats, senders, columns)
+    sql += " GROUP BY period, chat"
+    df = _read_sql(data_path, sql, parameters)
+    df['period'] = pd.to_datetime(df['period'], format=PERIODS[period])
+    return df.pivot_table(index='period', columns='chat', values='count', aggfunc='sum', fill_value=0)
+
+
+def _match(query, chats, senders, columns):
+    sql = "SELECT {} FROM messages WHERE messages MATCH ?".format(columns)
+    parameters = [query]
+    for column, values in [("chat", chats), ("sender", senders)]:
+        if values is not None:
+            values = list(values)
+            sql += " AND {} IN ({})".format(column, ", ".join("?" * len(values)))
+            parameters.extend(values)
+    return sql, parameters
+
+
+def _read_sql(data_path, sql, parameters):
+    import pandas as pd
+
+    if not exists(data_path):
+        raise IOError("No search index in {}, parse the messages with --index first.".format(data_path))
+    connection = sqlite3.connect(index_path(data_path))
+    try:
+        return pd.read_sql_query(sql, connection, params=parameters)
+    finally:
+        connection.close()
+
+
+@instrument.instrumented("plot_term_frequency")
+def plot_term_frequency(data_path, query, period="month", chats=None, top=8, show=False):
+    """
+    Plot how often query was used over time, stacked per chat.
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the root directory of your personal facebook data.
+    query : str
+        FTS5 query, see `search`.
+    period : {"year", "month", "day"}, default "month"
+        Length of the periods the matching messages are counted in.
+    chats : list of str or None, optional
+        Only count messages of these conversation directories.
+    top : int, default 8
+        Number of chats with the most matches that get their own color, the
+        others are combined.
+    show : bool, default to False
+        Show the generated plot.
+    """
+    from insights.messages import _chat_labels
+    import pandas as pd
+
+    df = term_frequency(data_path, query, period=period, chats=chats)
+    order = df.sum().sort_values(ascending=False).index
+    if len(order) > top:
+        other = df[order[top:]].sum(axis=1)
+        df = df[order[:top]].assign(other=other)
+    else:
+        df = df[order]
+    labels = _chat_labels([str(chat) for chat in df.columns])
+
+    fig = new_figure(show, figsize=(max(10, 0.25 * len(df)), 6))
+    ax = fig.add_subplot(111)
+    width = {"year": 300, "month": 25, "day": 0.8}[period]
+    bottom = pd.Series(0, index=df.index)
+    for color, column, label in zip(get_colors(len(df.columns)), df.columns, labels):
+        ax.bar(df.index, df[column], width=width, bottom=bottom, align='edge', color=color, alpha=0.8,
+               label=label)
+        bottom = bottom + df[column]
+    ax.xaxis_date()
+    ax.yaxis.grid(linestyle=':', alpha=0.6)
+    ax.set_ylabel("Messages")
+    ax.set_title("Messages matching {}".format(query))
+    ax.legend(loc='upper left')
+
+    output_path = os.path.join(data_path, "output")
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+    slug = re.sub(r"[^\w]+", "_", query).strip("_") or "query"
+    file_name = os.path.join(output_path, "term_frequency_{}.png".format(slug))
+    save_figure(fig, file_name, show)
@@ -0,0 +1,256 @@
+import os
+
+from insights import instrument
+from insights.messages import _chat_labels, load_messages
+from insights.utils import new_figure, save_figure
+import numpy as np
+import pandas as pd
+
+
+SESSION_GAP = 60
+
+
+def sessions(df, gap=SESSION_GAP):
+    """
+    Split the messages of every chat in sessions separated by inactivity.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Messages with columns time, sender and chat as returned by `load_messages`.
+    gap : int, default SESSION_GAP
+        A message more than gap minutes after the previous message of its chat
+        starts a new session.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per session with columns chat, initiator (sender of its first
+        message), start, end (datetime64) and messages.
+    """
+    arrays = _sorted_arrays(df)
+    chat, sender, minutes = arrays['chat'], arrays['sender'], arrays['minutes']
+    starts = np.flatnonzero(_session_starts(chat, minutes, gap))
+    ends = np.append(starts[1:], len(minutes)) - 1
+    return pd.DataFrame({
+        'chat': pd.Categorical.from_codes(chat[starts], arrays['chats']),
+        'initiator': pd.Categorical.from_codes(sender[starts], arrays['senders']),
+        'start': minutes[starts].astype('datetime64[m]').astype('datetime64[ns]'),
+        'end': minutes[ends].astype('datetime64[m]').astype('datetime64[ns]'),
+        'messages': np.diff(np.append(starts, len(minutes))),
+    })
+
+
+def replies(df, max_latency=None):
+    """
+    Every reply, a message that follows a message of another sender in the same chat.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Messages with columns time, sender and chat as returned by `load_messages`.
+    max_latency : int or None, optional
+        Ignore replies that come more than max_latency minutes after the message
+        they answer.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns chat, sender, replied_to, time (datetime64) of the reply and
+        latency in minutes.
+    """
+    arrays = _sorted_arrays(df)
+    chat, sender, minutes = arrays['chat'], arrays['sender'], arrays['minutes']
+    latency = np.diff(minutes)
+    reply = (chat[1:] == chat[:-1]) & (sender[1:] != sender[:-1])
+    if max_latency is not None:
+        reply &= latency <= max_latency
+    index = np.flatnonzero(reply)
+    return pd.DataFrame({
+        'chat': pd.Categorical.from_codes(chat[index + 1], arrays['chats']),
+        'sender': pd.Categorical.from_codes(sender[index + 1], arrays['senders']),
+        'replied_to': pd.Categorical.from_codes(sender[index], arrays['senders']),
+        'time': minutes[index + 1].astype('datetime64[m]').astype('datetime64[ns]'),
+        'latency': latency[index],
+    })
+
+
+@instrument.instrumented("chat_statistics")
+def chat_statistics(data_path, df=None, gap=SESSION_GAP, max_latency=None):
+    """
+    Per chat and sender: messages, sessions initiated and median reply time.
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the root directory of your personal facebook data.
+    df : pandas.DataFrame or None, optional
+        Messages of all conversations as returned by `load_messages`. If None,
+        they are loaded from data_path.
+    gap : int, default SESSION_GAP
+        Minutes of inactivity that end a session, see `sessions`.
+    max_latency : int or None, optional
+        Ignore slower replies, see `replies`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Indexed by chat and sender with columns messages, sessions (of the
+        chat), initiated, initiation_rate, replies and median_reply_minutes.
+    """
+    if df is None:
+        df = load_messages(data_path, columns=['time', 'sender', 'chat'], lean=True)
+    instrument.add_rows(len(df))
+    keys = [df['chat'].astype('category'), df['sender'].astype('category')]
+    statistics = df.groupby(keys, observed=True).size().to_frame('messages')
+
+    chat_sessions = sessions(df, gap=gap)
+    session_counts = chat_sessions.groupby('chat', observed=True).size()
+    statistics['sessions'] = session_counts.reindex(statistics.index.get_level_values(0)).values
+    initiated = chat_sessions.groupby(['chat', 'initiator'], observed=True).size()
+    statistics['initiated'] = initiated.reindex(statistics.index, fill_value=0).values
+    statistics['initiation_rate'] = statistics['initiated'] / statistics['sessions']
+
+    chat_replies = replies(df, max_latency=max_latency).groupby(['chat', 'sender'], observed=True)['latency']
+    statistics['replies'] = chat_replies.size().reindex(statistics.index, fill_value=0).values
+    statistics['median_reply_minutes'] = chat_replies.median().reindex(statistics.index).values
+    statistics.index.names = ['chat', 'sender']
+    return statistics
+
+
+def _sorted_arrays(df):
+    """
+    Integer chat and sender codes and timestamps in minutes, sorted by chat and time in one pass.
+
+    The export lists every conversation newest first and the stable time sorts
+    keep that order for messages with the same timestamp, so those are ordered
+    by their position in the frame descending to restore the order they were sent in.
+    """
+    chat = df['chat'].astype('category')
+    sender = df['sender'].astype('category')
+    times = df['time'].values.astype('datetime64[ns]').astype(np.int64)
+    chat_codes = chat.cat.codes.values
+    order = np.lexsort((-np.arange(len(df)), times, chat_codes))
+    minutes = df['time'].values.astype('datetime64[m]').astype(np.int64)[order]
+    return {'chat': chat_codes[order], 'sender': sender.cat.codes.values[order], 'minutes': minutes,
+            'chats': chat.cat.categories, 'senders': sender.cat.categories}
+
+
+def _session_starts(chat, minutes, gap):
+    starts = np.ones(len(minutes), dtype=bool)
+    starts[1:] = (chat[1:] != chat[:-1]) | (np.diff(minutes) > gap)
+    return starts
+
+
+def _top_chats(statistics, sender, top):
+    """
+    The top chats with the most messages and the statistics of sender in them.
+    """
+    if sender not in statistics.index.get_level_values('sender'):
+        raise ValueError("No messages of {}.".format(sender))
+    chats = statistics.groupby(level='chat', observed=True)['messages'].sum()
+    chats = chats.sort_values(ascending=False, kind='mergesort').head(top).index
+    return chats, statistics.xs(sender, level='sender').reindex(chats)
+
+
+@instrument.instrumented("plot_reply_times")
+def plot_reply_times(data_path, sender, top=20, df=None, max_latency=None, show=False):
+    """
+    Plot the median reply time of sender and of the other participants in the most active chats.
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the root directory of your personal facebook data.
+    sender : str
+        Name of the sender of the messages. Recommended to be your own name.
+    top : int, default 20
+        Number of chats with the most messages to show.
+    df : pandas.DataFrame or None, optional
+        Messages of all conversations as returned by `load_messages`. If None,
+        they are loaded from data_path.
+    max_latency : int or None, optional
+        Ignore replies that take longer than max_latency minutes.
+    show : bool, default to False
+        Show the generated plot.
+
+    """
+    if df is None:
+        df = load_messages(data_path, columns=['time', 'sender', 'chat'], lean=True)
+    chat_replies = replies(df, max_latency=max_latency)
+    from_sender = (chat_replies['sender'] == sender).values
+    own = chat_replies[from_sender].groupby('chat', observed=True)['latency'].median()
+    others = chat_replies[~from_sender].groupby('chat', observed=True)['latency'].median()
+    chats = df['chat'].value_counts().head(top).index
+    chats = chats[chats.isin(own.index) | chats.isin(others.index)]
+    own, others = own.reindex(chats), others.reindex(chats)
+
+    fig = new_figure(show, figsize=(8, 0.4 * len(chats) + 2))
+    ax = fig.add_subplot(111)
+    positions = np.arange(len(chats))
+    ax.barh(positions - 0.2, own.values, height=0.4, color="#4286f4", label=sender)
+    ax.barh(positions + 0.2, others.values, height=0.4, color="#f4a142", label="others")
+    ax.set_yticks(positions)
+    ax.set_yticklabels(_chat_labels([str(chat) for chat in chats]))
+    ax.invert_yaxis()
+    ax.xaxis.grid(linestyle=':', alpha=0.6)
+    ax.set_xlabel("Median reply time (minutes)")
+    ax.set_title("Reply times.")
+    ax.legend(loc='lower right')
+
+    output_path = os.path.join(data_path, "output")
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+
+    file_name = "reply_times_{}.png".format(sender.replace(" ", "_"))
+    file_name = os.path.join(output_path, file_name)
+    save_figure(fig, file_name, show)
+
+
+@instrument.instrumented("plot_initiation_rates")
+def plot_initiation_rates(data_path, sender, top=20, df=None, gap=SESSION_GAP, show=False):
+    """
+    Plot the share of conversation sessions started by sender in the most active chats.
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the root directory of your personal facebook data.
+    sender : str
+        Name of the sender of the messages. Recommended to be your own name.
+    top : int, default 20
+        Number of chats with the most messages to show.
+    df : pandas.DataFrame or None, optional
+        Messages of all conversations as returned by `load_messages`. If None,
+        they are loaded from data_path.
+    gap : int, default SESSION_GAP
+        Minutes of inactivity that end a session.
+    show : bool, default to False
+        Show the generated plot.
+
+    """
+    statistics = chat_statistics(data_path, df=df, gap=gap)
+    chats, own = _top_chats(statistics, sender, top)
+    sessions_per_chat = statistics.groupby(level='chat', observed=True)['sessions'].first().reindex(chats)
+    rates = own['initiation_rate'].fillna(0)
+
+    fig = new_figure(show, figsize=(8, 0.4 * len(chats) + 2))
+    ax = fig.add_subplot(111)
+    positions = np.arange(len(chats))
+    ax.barh(positions, rates.values, color="#4286f4")
+    for position, rate, count in zip(positions, rates.values, sessions_per_chat.values):
+        ax.text(rate + 0.01, position, "{:.0%} of {}".format(rate, count), va='center', size=9)
+    ax.set_xlim(0, 1.15)
+    ax.set_yticks(positions)
+    ax.set_yticklabels(_chat_labels([str(chat) for chat in chats]))
+    ax.invert_yaxis()
+    ax.set_xlabel("Sessions started by {}".format(sender))
+    ax.set_title("Conversation initiation.")
+
+    output_path = os.path.join(data_path, "output")
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+
+    file_name = "initiation_rates_{}.png".format(sender.replace(" ", "_"))
+    file_name = os.path.join(output_path, file_name)
+    save_figure(fig, file_name, show)
@@ -0,0 +1,187 @@
+import os
+import shutil
+from urllib.parse import quote, unquote
+
+
+STORE_DIR = "messages/store"
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+    except ImportError:
+        raise ImportError("The consolidated message store requires pyarrow: pip install pyarrow")
+    return pyarrow
+
+
+def store_path(data_path):
+    """
+    Location of the consolidated message store inside the data root.
+    """
+    return os.path.join(data_path, STORE_DIR)
+
+
+def exists(data_path):
+    path = store_path(data_path)
+    return os.path.isdir(path) and any(name.startswith("chat=") for name in os.listdir(path))
+
+
+def _chat_dir(path, conversation):
+    return os.path.join(path, "chat=" + quote(conversation, safe=""))
+
+
+def chat_path(data_path, conversation):
+    """
+    Directory holding the partition of a single conversation.
+    """
+    return _chat_dir(store_path(data_path), conversation)
+
+
+def partition_chat(data_path, path):
+    """
+    Conversation whose partition holds the file at path.
+    """
+    name = os.path.relpath(path, store_path(data_path)).split(os.sep)[0]
+    return unquote(name[len("chat="):])
+
+
+def has_conversation(data_path, conversation):
+    return os.path.isdir(chat_path(data_path, conversation))
+
+
+def conversations(data_path):
+    """
+    Names of all conversations present in the store.
+    """
+    path = store_path(data_path)
+    if not os.path.isdir(path):
+        return []
+    return sorted(unquote(name[len("chat="):]) for name in os.listdir(path) if name.startswith("chat="))
+
+
+def write_conversation(data_path, conversation, rows):
+    """
+    Replace the partition of a single conversation in the store.
+
+    The conversation is written to a temporary directory, partitioned by year,
+    which is swapped in place once complete so readers never see a partially
+    written chat.
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the root directory of your personal facebook data.
+    conversation : str
+        Name of the conversation directory in messages/inbox.
+    rows : iterable of [time, sender, text]
+        Messages as produced by the parser, time formatted as in the html export.
+
+    Returns
+    -------
+    int
+        Number of messages written.
+    """
+    _require_pyarrow()
+    import pandas as pd
+    from insights.utils import parse_time
+
+    path = store_path(data_path)
+    chat_dir = _chat_dir(path, conversation)
+    # Directories starting with an underscore are ignored by the dataset reader.
+    tmp_dir = os.path.join(path, "_tmp_" + os.path.basename(chat_dir))
+    old_dir = os.path.join(path, "_old_" + os.path.basename(chat_dir))
+    for directory in [tmp_dir, old_dir]:
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+
+    df = pd.DataFrame(list(rows), columns=['time', 'sender', 'text'])
+    df['time'] = parse_time(df['time'])
+    df['sender'] = df['sender'].astype('category')
+    df['year'] = df['time'].dt.year.astype('int16')
+    os.makedirs(tmp_dir)
+    if len(df):
+        df.to_parquet(tmp_dir, engine="pyarrow", partition_cols=['year'], index=False)
+
+    if os.path.exists(chat_dir):
+        os.rename(chat_dir, old_dir)
+    os.rename(tmp_dir, chat_dir)
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
+    return len(df)
+
+
+def prune(data_path, keep):
+    """
+    Remove conversations from the store that are not in keep.
+    """
+    path = store_path(data_path)
+    keep = set(keep)
+    for conversation in conversations(data_path):
+        if conversation not in keep:
+            shutil.rmtree(_chat_dir(path, conversation))
+
+
+def read_messages(data_path, chats=None, years=None, columns=None):
+    """
+    Load messages from the consolidated store in one bulk read.
+
+    Parameters
+    ----------
+    data_path : str
+        Path to the root directory of your personal facebook data.
+    chats : list of str or None, optional
+        Only read these conversations. Other partitions are not opened.
+    years : tuple(start_year, end_year) or None, optional
+        Only read messages from this (inclusive) range of years.
+    columns : list of str or None, optional
+        Columns to read, all columns if None.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns time (datetime64), sender (categorical), text and chat (categorical).
+    """
+    pa = _require_pyarrow()
+    import pandas as pd
+
+    partitioning = _partitioning(pa)
+    filters = []
+    if chats is not None:
+        filters.append(('chat', 'in', list(chats)))
+    if years is not None:
+        filters.append(('year', '>=', years[0]))
+        filters.append(('year', '<=', years[1]))
+    if columns is not None:
+        columns = [column for column in columns if column != 'year']
+
+    df = pd.read_parquet(store_path(data_path), engine="pyarrow", columns=columns,
+                         filters=filters or None, partitioning=partitioning)
+    if 'year' in df.columns:
+        df = df.drop(columns='year')
+    for column in ['sender', 'chat']:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    return df
+
+
+def iter_batches(data_path, chats=None, columns=None, batch_size=100000):
+    """
+    Stream messages from the store in frames of at most batch_size rows.
+
+    Parameters are as in `read_messages`. Only one batch is held in memory at
+    a time, chat is returned as a plain string column.
+    """
+    pa = _require_pyarrow()
+
+    dataset = pa.dataset.dataset(store_path(data_path), format="parquet", partitioning=_partitioning(pa))
+    condition = pa.dataset.field('chat').isin(list(chats)) if chats is not None else None
+    if columns is not None:
+        columns = [column for column in columns if column != 'year']
+    for batch in dataset.to_batches(columns=columns, filter=condition, batch_size=batch_size):
+        if batch.num_rows:
+            yield batch.to_pandas()
+
+
+def _partitioning(pa):
+    return pa.dataset.partitioning(pa.schema([('chat', pa.string()), ('year', pa.int16())]), flavor="hive")
@@ -1,9 +1,109 @@
 import colorsys
 
+from insights import instrument
+
+
+TIME_FORMAT = "%d %B %Y %H:%M"
+MONTHS = {name: number for number, name in enumerate(
+    ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October',
+     'November', 'December'], 1)}
+TIME_PATTERN = r"^(\d{1,2}) ([A-Za-z]+) (\d{4}) (\d{1,2}):(\d{2})$"
+
+
 def get_colors(N=5):
     return  [colorsys.hsv_to_rgb(x*1.0/N, 0.5, 0.5) for x in range(N)]
 
 def m2hm(x, i):
     h = int(x/60)
     m = int(x%60)
-    return '%(h)02d:%(m)02d' % {'h':h,'m':m}
\ No newline at end of file
+    return '%(h)02d:%(m)02d' % {'h':h,'m':m}
+
+def new_figure(show=False, **kwargs):
+    """
+    Create a figure that is only registered with pyplot when it has to be shown,
+    so batch rendering does not depend on global pyplot state.
+    """
+    if show:
+        import matplotlib.pyplot as plt
+        return plt.figure(**kwargs)
+    from matplotlib.figure import Figure
+    return Figure(**kwargs)
+
+@instrument.instrumented("savefig")
+def save_figure(fig, file_name, show=False):
+    fig.savefig(file_name, bbox_inches='tight')
+    if show:
+        import matplotlib.pyplot as plt
+        plt.show()
+        plt.close(fig)
+
+def compact_frame(df, categories=()):
+    """
+    Convert the given columns to categoricals and downcast the integer columns of df.
+    """
+    import pandas as pd
+
+    df = df.copy()
+    for column in categories:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    for column in df.select_dtypes(include='integer').columns:
+        df[column] = pd.to_numeric(df[column], downcast='integer')
+    return df
+
+def format_bytes(size):
+    for unit in ['B', 'KB', 'MB']:
+        if size < 1024:
+            return "{:.1f} {}".format(size, unit)
+        size /= 1024.0
+    return "{:.1f} GB".format(size)
+
+@instrument.instrumented("parse_time")
+def parse_time(values):
+    """
+    Vectorized equivalent of pd.to_datetime(values, format="%d %B %Y %H:%M").
+
+    Every distinct timestamp string is split into its components only once, the
+    month name is mapped through a lookup table and the datetime64 values are
+    assembled with integer arithmetic. Falls back to pd.to_datetime when a value
+    does not follow the export format.
+
+    Parameters
+    ----------
+    values : pandas.Series
+        Timestamps as written by the parser, e.g. "25 May 2018 14:03".
+
+    Returns
+    -------
+    pandas.Series
+        datetime64 series with the same index as values.
+    """
+    import numpy as np
+    import pandas as pd
+
+    values = pd.Series(values)
+    codes, uniques = pd.factorize(values)
+    if len(uniques) == 0:
+        return pd.Series(pd.NaT, index=values.index, name=values.name, dtype='datetime64[ns]')
+    parts = pd.Series(uniques, dtype=object).str.extract(TIME_PATTERN)
+    months = parts[1].map(MONTHS)
+    if parts.isnull().values.any() or months.isnull().values.any():
+        return pd.to_datetime(values, format=TIME_FORMAT)
+
+    years = parts[2].astype(np.int64).values
+    months = months.astype(np.int64).values
+    days = parts[0].astype(np.int64).values
+    minutes = parts[3].astype(np.int64).values * 60 + parts[4].astype(np.int64).values
+    if (days.min() < 1 or days.max() > 31 or minutes.max() >= 24 * 60):
+        return pd.to_datetime(values, format=TIME_FORMAT)
+
+    month_start = ((years - 1970) * 12 + months - 1).astype('datetime64[M]').astype('datetime64[D]')
+    dates = month_start + (days - 1).astype('timedelta64[D]')
+    if (dates.astype('datetime64[M]') != month_start.astype('datetime64[M]')).any():
+        # Day out of range for its month, let pandas raise the usual error.
+        return pd.to_datetime(values, format=TIME_FORMAT)
+    parsed = dates.astype('datetime64[ns]') + minutes.astype('timedelta64[m]')
+
+    result = parsed.take(codes)
+    result[codes < 0] = np.datetime64('NaT')
+    return pd.Series(result, index=values.index, name=values.name)